@@ -0,0 +1,187 @@
+# 输出文件原子写入与运行锁模块
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+from config import RUN_LOCK_FILE
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+STAGING_PREFIX = '.staging-'
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# 进程启动时的umask，新建文件的权限与open()创建的文件一致
+_UMASK = _current_umask()
+
+
+def _copy_mode(tmp_path, target_path):
+    """临时文件替换目标前设置权限：沿用已有文件的权限，新文件按umask（mkstemp创建的文件为0600）"""
+    try:
+        mode = os.stat(target_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+
+def _try_lock(fd):
+    """尝试对文件加排他锁，成功返回True"""
+    try:
+        if sys.platform == 'win32':
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd):
+    if sys.platform == 'win32':
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def run_lock(path=RUN_LOCK_FILE, timeout=0):
+    """运行锁，防止定时任务与手动触发的任务同时运行
+
+    进程退出时操作系统自动释放锁，不会因崩溃留下死锁
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    try:
+        while not _try_lock(fd):
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"已有任务正在运行（锁文件: {path}）")
+            time.sleep(1)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path, text):
+    """先写入同目录的临时文件再替换，读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        _copy_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_text_if_changed(path, text):
+    """内容哈希与现有文件相同时跳过写入，避免无实质变化的文件产生提交，返回是否写入"""
+    new_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    try:
+        with open(path, 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() == new_hash:
+                return False
+    except FileNotFoundError:
+        pass
+    atomic_write_text(path, text)
+    return True
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _same_content(path, other):
+    """两个文件内容是否相同（other不存在时为False）"""
+    try:
+        return os.path.getsize(path) == os.path.getsize(other) and _file_sha256(path) == _file_sha256(other)
+    except FileNotFoundError:
+        return False
+
+
+def atomic_write_json(path, data, **kwargs):
+    """原子写入JSON文件，内容未变化时跳过写入，返回是否写入"""
+    kwargs.setdefault('ensure_ascii', False)
+    return write_text_if_changed(path, json.dumps(data, **kwargs))
+
+
+class StagedOutput:
+    """暂存输出目录
+
+    所有文件先写入目标目录旁的临时目录，全部写完后再逐个原子替换到目标目录；
+    中途出错时丢弃临时目录，目标目录保持上一次的完整结果
+    """
+
+    def __init__(self, target_dir):
+        self.target_dir = target_dir
+        self.staging_dir = None
+
+    def __enter__(self):
+        os.makedirs(self.target_dir, exist_ok=True)
+        self.staging_dir = tempfile.mkdtemp(dir=self.target_dir, prefix=STAGING_PREFIX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+        return False
+
+    def path(self, name):
+        """暂存目录中的文件路径"""
+        return os.path.join(self.staging_dir, name)
+
+    def commit(self):
+        """将暂存的文件逐个原子替换到目标目录，内容未变化的文件不替换"""
+        names = sorted(os.listdir(self.staging_dir))
+        changed = 0
+        for name in names:
+            staged_path = os.path.join(self.staging_dir, name)
+            target_path = os.path.join(self.target_dir, name)
+            if _same_content(staged_path, target_path):
+                continue
+            _copy_mode(staged_path, target_path)
+            os.replace(staged_path, target_path)
+            changed += 1
+        logging.info(f"已将 {changed}/{len(names)} 个文件更新到 {self.target_dir}，其余内容未变化")
+
+
+def cleanup_stale_staging(target_dir):
+    """清理异常退出时遗留的暂存目录（需在持有运行锁时调用）"""
+    if not os.path.isdir(target_dir):
+        return
+    for name in os.listdir(target_dir):
+        if name.startswith(STAGING_PREFIX):
+            shutil.rmtree(os.path.join(target_dir, name), ignore_errors=True)
+            logging.warning(f"已清理遗留的暂存目录: {name}")
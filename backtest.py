@@ -0,0 +1,211 @@
+# 买点规则参数回测模块
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import (DB_PATH, STOCKS_DATA_FILE, BUY_POINT_PE_THRESHOLD, HIGH_PE_DISCOUNT,
+                    LOW_PE_DISCOUNT, FUTURE_PE_FACTOR)
+
+# 与估值计算保持一致：最近5年有效PE计算均值和标准差，至少需要4年数据
+PE_WINDOW = 1250
+PE_MIN_PERIODS = 1000
+# 与估值计算的get_clean_stock_data(window=2500)一致：每个股票只使用最近2500个交易日中通过校验的数据
+HISTORY_WINDOW = 2500
+
+# 参数网格中每个组合的字段顺序
+GRID_FIELDS = ['std_multiple_scale', 'pe_threshold', 'high_discount', 'low_discount', 'future_pe_factor']
+
+# 工作进程共享的预计算数据，由_init_worker设置
+_SERIES = None
+
+
+def load_history(db_path=DB_PATH, window=HISTORY_WINDOW):
+    """加载所有股票最近window个交易日中通过数据质量校验的历史数据，以及业绩预测区间"""
+    conn = sqlite3.connect(db_path)
+    try:
+        basic = pd.read_sql_query('''
+            SELECT c.symbol, c.timestamp, c.trade_date, c.close, c.pe, c.market_capital
+            FROM stock_clean_data c
+            JOIN (
+                SELECT symbol, MIN(timestamp) AS start_timestamp FROM (
+                    SELECT symbol, timestamp,
+                           ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) AS rn
+                    FROM stock_basic_data
+                ) WHERE rn <= ?
+                GROUP BY symbol
+            ) w ON w.symbol = c.symbol AND c.timestamp >= w.start_timestamp
+            ORDER BY c.symbol, c.timestamp
+        ''', conn, params=(window,))
+        forecasts = pd.read_sql_query('''
+            SELECT symbol, forecast_year, forecast_net_profit, valid_from
+            FROM stock_profit_forecast
+            ORDER BY symbol, valid_from, forecast_year
+        ''', conn)
+    finally:
+        conn.close()
+    return basic, forecasts
+
+
+def precompute_series(basic, forecasts, std_multiples, horizon):
+    """计算一次滚动统计量和远期收益，所有参数组合共用
+
+    返回按股票拼接的扁平数组字典，只保留滚动统计有效且有远期收益的交易日
+    """
+    parts = []
+    for symbol, df in basic.groupby('symbol', sort=False):
+        if symbol not in std_multiples:
+            continue
+        df = df.reset_index(drop=True)
+
+        # 只在有效PE上滚动，与calculate_valuation_metrics过滤pe>0的口径一致
+        valid_pe = df['pe'].where(df['pe'] > 0)
+        pe_only = valid_pe.dropna()
+        rolling = pe_only.rolling(PE_WINDOW, min_periods=PE_MIN_PERIODS)
+        avg_pe = rolling.mean().reindex(df.index).ffill()
+        std_pe = rolling.std().reindex(df.index).ffill()
+
+        close = df['close'].to_numpy(dtype=float)
+        forward_return = np.full(len(df), np.nan)
+        if len(df) > horizon:
+            forward_return[:-horizon] = close[horizon:] / close[:-horizon] - 1
+
+        # 按交易日匹配当时有效的最新业绩预测
+        profit = np.full(len(df), np.nan)
+        symbol_forecasts = forecasts[forecasts['symbol'] == symbol]
+        if not symbol_forecasts.empty:
+            position = np.searchsorted(symbol_forecasts['valid_from'].to_numpy(), df['trade_date'].to_numpy(dtype=str),
+                                       side='right') - 1
+            has_forecast = position >= 0
+            profit[has_forecast] = symbol_forecasts['forecast_net_profit'].to_numpy()[position[has_forecast]]
+
+        keep = (valid_pe.notna() & avg_pe.notna() & std_pe.notna()).to_numpy() & ~np.isnan(forward_return)
+        if not keep.any():
+            continue
+        parts.append({
+            'symbol_index': np.full(int(keep.sum()), len(parts)),
+            'std_multiple': np.full(int(keep.sum()), std_multiples[symbol]),
+            'pe': valid_pe.to_numpy()[keep],
+            'avg_pe': avg_pe.to_numpy()[keep],
+            'std_pe': std_pe.to_numpy()[keep],
+            'market_capital': df['market_capital'].to_numpy(dtype=float)[keep],
+            'profit': profit[keep],
+            'forward_return': forward_return[keep],
+        })
+
+    if not parts:
+        return None
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def evaluate(series, params):
+    """评估一组参数：统计两个买点规则触发后的远期收益"""
+    std_multiple_scale, pe_threshold, high_discount, low_discount, future_pe_factor = params
+    std_multiple = series['std_multiple'] * std_multiple_scale
+    reasonable_pe = ((series['avg_pe'] - series['std_pe'] * std_multiple) + series['avg_pe']) / 2
+    discount = np.where(reasonable_pe >= pe_threshold, high_discount, low_discount)
+    forward_return = series['forward_return']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 当前价 <= 当前价 / 估值 * 折扣  等价于  估值 <= 折扣
+        pe_valuation = series['pe'] / reasonable_pe
+        net_profit_valuation = series['market_capital'] / (reasonable_pe * future_pe_factor * series['profit'])
+    pe_signal = (reasonable_pe > 0) & (pe_valuation <= discount)
+    profit_signal = (reasonable_pe > 0) & (series['profit'] > 0) & (net_profit_valuation <= discount)
+
+    result = dict(zip(GRID_FIELDS, params))
+    baseline = float(forward_return.mean())
+    for name, signal in (('pe', pe_signal), ('profit', profit_signal)):
+        hits = forward_return[signal]
+        result[f'{name}_signals'] = int(signal.sum())
+        result[f'{name}_symbols'] = int(np.unique(series['symbol_index'][signal]).size)
+        result[f'{name}_avg_return'] = round(float(hits.mean()), 4) if hits.size else None
+        result[f'{name}_win_rate'] = round(float((hits > 0).mean()), 4) if hits.size else None
+        result[f'{name}_excess_return'] = round(float(hits.mean()) - baseline, 4) if hits.size else None
+    result['baseline_return'] = round(baseline, 4)
+    return result
+
+
+def _init_worker(series):
+    global _SERIES
+    _SERIES = series
+
+
+def _evaluate_chunk(grid_chunk):
+    return [evaluate(_SERIES, params) for params in grid_chunk]
+
+
+def run_sweep(series, grid, workers=1, chunk_size=16):
+    """在进程池中评估所有参数组合，预计算数据只在每个工作进程初始化时传递一次"""
+    if workers <= 1:
+        return [evaluate(series, params) for params in grid]
+
+    chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(series,)) as executor:
+        for chunk_result in executor.map(_evaluate_chunk, chunks):
+            results.extend(chunk_result)
+    return results
+
+
+def parse_values(text):
+    return [float(value) for value in text.split(',') if value.strip()]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='买点规则参数网格回测')
+    parser.add_argument('--std-multiple-scales', default='0.5,1.0,1.5',
+                        help='市盈率标准差倍数的缩放系数（乘以stocks_data.csv中每个股票的倍数）')
+    parser.add_argument('--pe-thresholds', default=str(BUY_POINT_PE_THRESHOLD), help='合理市盈率分界值')
+    parser.add_argument('--high-discounts', default=f'0.4,{HIGH_PE_DISCOUNT},0.6', help='高市盈率买点折扣')
+    parser.add_argument('--low-discounts', default=f'0.5,{LOW_PE_DISCOUNT},0.7', help='低市盈率买点折扣')
+    parser.add_argument('--future-pe-factors', default=f'0.7,{FUTURE_PE_FACTOR},0.9', help='三年后市盈率折扣')
+    parser.add_argument('--horizon', type=int, default=250, help='远期收益的交易日数')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--output', help='保存全部结果的JSON文件')
+    parser.add_argument('--top', type=int, default=10, help='输出超额收益最高的参数组合数量')
+    args = parser.parse_args()
+
+    symbols_df = pd.read_csv(STOCKS_DATA_FILE)
+    std_multiples = dict(zip(symbols_df['股票代码'], symbols_df['市盈率标准差倍数']))
+
+    start = time.perf_counter()
+    basic, forecasts = load_history(args.db)
+    series = precompute_series(basic, forecasts, std_multiples, args.horizon)
+    if series is None:
+        logging.error("没有可回测的数据")
+        return 1
+    logging.info(f"预计算完成: {len(series['pe'])} 个交易日样本，耗时 {time.perf_counter() - start:.2f} 秒")
+
+    grid = list(itertools.product(
+        parse_values(args.std_multiple_scales), parse_values(args.pe_thresholds),
+        parse_values(args.high_discounts), parse_values(args.low_discounts), parse_values(args.future_pe_factors)
+    ))
+    start = time.perf_counter()
+    results = run_sweep(series, grid, workers=args.workers)
+    logging.info(f"完成 {len(grid)} 个参数组合的回测，耗时 {time.perf_counter() - start:.2f} 秒")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    ranked = sorted((r for r in results if r['pe_excess_return'] is not None),
+                    key=lambda r: r['pe_excess_return'], reverse=True)
+    for r in ranked[:args.top]:
+        params = ' '.join(f"{field}={r[field]}" for field in GRID_FIELDS)
+        profit_excess = f"{r['profit_excess_return']:.2%}" if r['profit_excess_return'] is not None else '-'
+        print(f"{params} | 市盈率买点: {r['pe_signals']}次 超额收益 {r['pe_excess_return']:.2%} 胜率 {r['pe_win_rate']:.2%}"
+              f" | 利润买点: {r['profit_signals']}次 超额收益 {profit_excess}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
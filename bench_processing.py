@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+估值计算并行扩展性基准测试
+分别使用1..N个进程运行 process_all_stocks，统计耗时、吞吐量和加速比
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+from data_processor import StockDataProcessor
+
+
+def measure(workers, repeat=3, save=False):
+    """使用指定进程数多次运行估值计算，返回耗时中位数和成功处理的股票数"""
+    processor = StockDataProcessor()
+    seconds = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = processor.process_all_stocks(workers=workers, save=save)
+        seconds.append(time.perf_counter() - start)
+        count = len(results)
+    return statistics.median(seconds), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='估值计算多进程扩展性基准测试')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help='最大进程数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个进程数的测试次数，取中位数')
+    parser.add_argument('--save', action='store_true', help='同时写入估值表（默认只计算，不修改数据库）')
+    parser.add_argument('--json', dest='json_file', help='将结果保存为JSON文件，便于跟踪变化')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = []
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        seconds, count = measure(workers, args.repeat, args.save)
+        baseline = baseline or seconds
+        results.append({
+            'workers': workers,
+            'seconds': round(seconds, 3),
+            'symbols': count,
+            'symbols_per_second': round(count / seconds, 1) if seconds > 0 else None,
+            'speedup': round(baseline / seconds, 2) if seconds > 0 else None,
+        })
+
+    print(f"{'进程数':<8}{'耗时(s)':>10}{'股票数':>8}{'股票/秒':>10}{'加速比':>8}")
+    for result in results:
+        print(f"{result['workers']:<8}{result['seconds']:>10}{result['symbols']:>8}"
+              f"{result['symbols_per_second']:>10}{result['speedup']:>8}")
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
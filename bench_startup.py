@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准测试
+使用 python -X importtime 统计 main.py 各运行模式的冷启动导入耗时
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from main import MODE_MODULES
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """解析-X importtime输出，返回(顶层导入累计耗时us, {顶层模块: 累计耗时us})"""
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # 模块名前的缩进表示嵌套层级，无缩进的为顶层导入
+        if name.startswith(' ') and not name.startswith('  '):
+            top_level[name.strip()] = top_level.get(name.strip(), 0) + int(cumulative)
+    return sum(top_level.values()), top_level
+
+
+def measure_mode(mode, repeat=5):
+    """在新的解释器中多次导入指定模式的模块，返回统计结果"""
+    code = f"import main; main.load_mode_modules({mode!r})"
+    import_us = []
+    wall_ms = []
+    modules = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        )
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        total, top_level = parse_importtime(proc.stderr)
+        import_us.append(total)
+        for name, us in top_level.items():
+            modules.setdefault(name, []).append(us)
+
+    heaviest = sorted(((name, statistics.median(values) / 1000) for name, values in modules.items()),
+                      key=lambda item: item[1], reverse=True)[:5]
+    return {
+        'mode': mode,
+        'import_ms': round(statistics.median(import_us) / 1000, 1),
+        'wall_ms': round(statistics.median(wall_ms), 1),
+        'heaviest': [[name, round(ms, 1)] for name, ms in heaviest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py各运行模式冷启动耗时基准测试')
+    parser.add_argument('--modes', nargs='+', choices=list(MODE_MODULES), default=list(MODE_MODULES),
+                        help='需要测试的运行模式')
+    parser.add_argument('--repeat', type=int, default=5, help='每个模式的测试次数，取中位数')
+    parser.add_argument('--json', dest='json_file', help='将结果保存为JSON文件，便于跟踪变化')
+    args = parser.parse_args()
+
+    results = [measure_mode(mode, args.repeat) for mode in args.modes]
+
+    print(f"{'模式':<12}{'导入耗时(ms)':>14}{'进程耗时(ms)':>14}  最重的顶层导入")
+    for result in results:
+        heaviest = ', '.join(f"{name}={ms}ms" for name, ms in result['heaviest'][:3])
+        print(f"{result['mode']:<12}{result['import_ms']:>14}{result['wall_ms']:>14}  {heaviest}")
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# 紧凑时间序列存储模块
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+from config import DB_PATH
+from instruments import create_symbol_table
+
+# 交易日编码为北京时间的日序号（自1970-01-01起的天数），雪球时间戳为北京时间当日零点，
+# 两者之间只需整数运算即可互相转换
+BEIJING_OFFSET_MS = 8 * 3600 * 1000
+DAY_MS = 86400 * 1000
+TRADE_DATE_SQL = f"(timestamp + {BEIJING_OFFSET_MS}) / {DAY_MS}"
+TIMESTAMP_SQL = f"d.trade_date * {DAY_MS} - {BEIJING_OFFSET_MS}"
+
+
+class CompactStockStore:
+    """stock_basic_data的紧凑存储布局
+
+    stock_symbol: 股票代码维度表，使用整数symbol_id（与instruments.InstrumentRegistry共用）
+    stock_daily:  以(symbol_id, trade_date)为主键的WITHOUT ROWID表，
+                  不保存自增id、created_time和可推导的shares_outstanding
+    """
+
+    def __init__(self, db_path=DB_PATH, create_tables=True):
+        self.db_path = db_path
+        # 只读对比时不建表，避免修改数据库
+        if create_tables:
+            self._create_tables()
+
+    def _create_tables(self):
+        """创建紧凑存储表"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # 与证券注册表共用stock_symbol表，symbol_id在两处一致
+        create_symbol_table(cursor)
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_daily (
+                symbol_id INTEGER NOT NULL,
+                trade_date INTEGER NOT NULL,  -- 北京时间日序号
+                close REAL NOT NULL,
+                pe REAL,
+                market_capital REAL,
+                PRIMARY KEY (symbol_id, trade_date)
+            ) WITHOUT ROWID
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    def migrate_from_basic_data(self):
+        """从stock_basic_data同步数据到紧凑布局，可重复执行"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                INSERT OR IGNORE INTO stock_symbol (symbol)
+                SELECT DISTINCT symbol FROM stock_basic_data ORDER BY symbol
+            ''')
+            # 同一股票落在同一北京时间交易日的多条数据在紧凑布局中只能保存一条，保留时间戳最新的一条
+            merged = cursor.execute(f'''
+                SELECT COALESCE(SUM(n - 1), 0) FROM (
+                    SELECT COUNT(*) AS n FROM stock_basic_data
+                    GROUP BY symbol, {TRADE_DATE_SQL}
+                    HAVING n > 1
+                )
+            ''').fetchone()[0]
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO stock_daily (symbol_id, trade_date, close, pe, market_capital)
+                SELECT s.symbol_id, b.day, b.close, b.pe, b.market_capital
+                FROM (
+                    SELECT symbol, {TRADE_DATE_SQL} AS day, close, pe, market_capital,
+                           ROW_NUMBER() OVER (PARTITION BY symbol, {TRADE_DATE_SQL} ORDER BY timestamp DESC) AS rn
+                    FROM stock_basic_data
+                ) b
+                JOIN stock_symbol s ON s.symbol = b.symbol
+                WHERE b.rn = 1
+            ''')
+            count = cursor.rowcount
+            conn.commit()
+            if merged:
+                logging.warning(f"有 {merged} 条数据与同一交易日的其他数据重复，已合并为时间戳最新的一条")
+            logging.info(f"紧凑布局迁移完成，共写入 {count} 条数据")
+            return count
+        except Exception as e:
+            logging.error(f"紧凑布局迁移失败: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_stock_data_by_symbol(self, symbol, limit=None):
+        """根据股票代码获取数据，返回格式与StockDatabase.get_stock_data_by_symbol一致"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        query = f'''
+            SELECT ?, {TIMESTAMP_SQL}, d.close, d.pe, d.market_capital,
+                   CASE WHEN d.close > 0 THEN d.market_capital / d.close ELSE 0 END,
+                   date(d.trade_date * 86400, 'unixepoch')
+            FROM stock_daily d
+            WHERE d.symbol_id = (SELECT symbol_id FROM stock_symbol WHERE symbol = ?)
+            ORDER BY d.trade_date DESC
+        '''
+
+        if limit:
+            query += f' LIMIT {limit}'
+
+        cursor.execute(query, (symbol, symbol))
+        results = cursor.fetchall()
+        conn.close()
+
+        return results
+
+
+def compact_layout_exists(db_path=DB_PATH):
+    """紧凑布局表是否已存在且有数据"""
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_daily'").fetchone():
+            return False
+        return conn.execute('SELECT 1 FROM stock_daily LIMIT 1').fetchone() is not None
+    finally:
+        conn.close()
+
+
+def _vacuumed_size(db_path, tables):
+    """将指定表复制到临时库并VACUUM，返回文件字节数"""
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        conn.execute('ATTACH DATABASE ? AS src', (db_path,))
+        for table in tables:
+            sql = conn.execute(
+                "SELECT sql FROM src.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            conn.execute(sql)
+            conn.execute(f'INSERT INTO main.{table} SELECT * FROM src.{table}')
+            for (index_sql,) in conn.execute(
+                "SELECT sql FROM src.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (table,)
+            ).fetchall():
+                conn.execute(index_sql)
+        conn.commit()
+        conn.execute('DETACH DATABASE src')
+        conn.execute('VACUUM')
+        conn.close()
+        return os.path.getsize(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def _time_scan(fetch, symbols, repeat):
+    """对所有股票执行repeat轮查询，返回(最佳耗时秒, 行数)"""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = sum(len(fetch(symbol)) for symbol in symbols)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def compare_layouts(db_path=DB_PATH, limit=2500, repeat=3):
+    """对比行式布局与紧凑布局的存储大小和扫描速度（只读，需先执行migrate）"""
+    from database import StockDatabase
+
+    db = StockDatabase(db_path, create_tables=False)
+    store = CompactStockStore(db_path, create_tables=False)
+
+    conn = sqlite3.connect(db_path)
+    symbols = [row[0] for row in conn.execute('SELECT symbol FROM stock_symbol ORDER BY symbol_id')]
+    conn.close()
+
+    row_size = _vacuumed_size(db_path, ['stock_basic_data'])
+    compact_size = _vacuumed_size(db_path, ['stock_symbol', 'stock_daily'])
+    row_time, row_rows = _time_scan(lambda s: db.get_stock_data_by_symbol(s, limit=limit), symbols, repeat)
+    compact_time, compact_rows = _time_scan(lambda s: store.get_stock_data_by_symbol(s, limit=limit), symbols, repeat)
+
+    return {
+        'symbols': len(symbols),
+        'row_size': row_size,
+        'compact_size': compact_size,
+        'row_scan_seconds': row_time,
+        'compact_scan_seconds': compact_time,
+        'row_rows': row_rows,
+        'compact_rows': compact_rows,
+    }
+
+
+def print_report(report):
+    """输出对比报告"""
+    def ratio(a, b):
+        return f"{a / b:.2f}x" if b else "-"
+
+    print(f"股票数量: {report['symbols']}")
+    print(f"{'布局':<10}{'大小(KB)':>12}{'扫描耗时(ms)':>16}{'行数':>10}")
+    print(f"{'row':<10}{report['row_size'] / 1024:>12.1f}{report['row_scan_seconds'] * 1000:>16.1f}{report['row_rows']:>10}")
+    print(f"{'compact':<10}{report['compact_size'] / 1024:>12.1f}{report['compact_scan_seconds'] * 1000:>16.1f}{report['compact_rows']:>10}")
+    print(f"大小比: {ratio(report['row_size'], report['compact_size'])}  "
+          f"扫描加速: {ratio(report['row_scan_seconds'], report['compact_scan_seconds'])}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='stock_basic_data紧凑存储迁移与对比工具')
+    parser.add_argument('action', choices=['migrate', 'report'],
+                        help='migrate-同步数据到紧凑布局, report-对比存储大小和扫描速度（只读）')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--limit', type=int, default=2500, help='每个股票扫描的行数')
+    parser.add_argument('--repeat', type=int, default=3, help='扫描重复次数，取最佳值')
+    args = parser.parse_args()
+
+    if args.action == 'migrate':
+        CompactStockStore(args.db).migrate_from_basic_data()
+        return 0
+
+    if not compact_layout_exists(args.db):
+        logging.error("紧凑布局不存在或为空，请先执行 migrate")
+        return 1
+    print_report(compare_layouts(args.db, limit=args.limit, repeat=args.repeat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,10 @@
 # 配置文件
 import os
 from datetime import datetime, timedelta
-import pytz
+from zoneinfo import ZoneInfo
 
 # 时区配置
-beijing_tz = pytz.timezone('Asia/Shanghai')
+beijing_tz = ZoneInfo('Asia/Shanghai')
 
 # 数据库配置
 DB_PATH = os.path.join('data', 'db', 'stock_valuation.db')
@@ -16,8 +16,31 @@ tomorrow = now + timedelta(days=1)
 # 转换为毫秒级时间戳
 timestamp_ms = int(tomorrow.timestamp() * 1000)
 
+# 行情数据源地址
+# 设置环境变量 MARKET_DATA_BASE_URL 后所有数据源都指向同一个地址（如本地模拟服务器 mock_server.py），
+# 也可以通过 XUEQIU_BASE_URL 等环境变量单独替换某个数据源
+MARKET_DATA_BASE_URL = os.environ.get('MARKET_DATA_BASE_URL')
+
+# 各数据源的真实地址（mock_server.py录制模式也按此转发请求）
+UPSTREAM_BASE_URLS = {
+    'XUEQIU_BASE_URL': 'https://stock.xueqiu.com',
+    'THS_BASE_URL': 'https://basic.10jqka.com.cn',
+    'ETNET_BASE_URL': 'https://www.etnet.com.hk',
+    'TENCENT_QUOTE_BASE_URL': 'https://qt.gtimg.cn',
+    'EXCHANGE_RATE_BASE_URL': 'https://api.exchangerate-api.com',
+}
+
+def _base_url(name):
+    return (MARKET_DATA_BASE_URL or os.environ.get(name) or UPSTREAM_BASE_URLS[name]).rstrip('/')
+
+XUEQIU_BASE_URL = _base_url('XUEQIU_BASE_URL')
+THS_BASE_URL = _base_url('THS_BASE_URL')
+ETNET_BASE_URL = _base_url('ETNET_BASE_URL')
+TENCENT_QUOTE_BASE_URL = _base_url('TENCENT_QUOTE_BASE_URL')
+EXCHANGE_RATE_BASE_URL = _base_url('EXCHANGE_RATE_BASE_URL')
+
 # API配置
-XUEQIU_API_URL = "https://stock.xueqiu.com/v5/stock/chart/kline.json"
+XUEQIU_API_URL = f"{XUEQIU_BASE_URL}/v5/stock/chart/kline.json"
 API_PARAMS = {
     'symbol': 'SH000001',
     'begin': timestamp_ms,
@@ -43,8 +66,56 @@ TRADING_DAYS_PER_YEAR = -250
 FIVE_YEARS_TRADING_DAYS = 5 * TRADING_DAYS_PER_YEAR
 TEN_YEARS_TRADING_DAYS = 10 * TRADING_DAYS_PER_YEAR
 
+# 买点规则配置
+BUY_POINT_PE_THRESHOLD = 20  # 合理市盈率分界值
+HIGH_PE_DISCOUNT = 0.5  # 合理市盈率>=分界值时的买点折扣
+LOW_PE_DISCOUNT = 0.6  # 合理市盈率<分界值时的买点折扣
+FUTURE_PE_FACTOR = 0.8  # 三年后市盈率为当前合理市盈率的折扣
+
+# 数据质量校验配置
+QUALITY_MAX_PE = 1000  # 市盈率超过该值视为异常
+QUALITY_MAX_LOG_RETURN = 0.4  # 与前一交易日收盘价的对数涨跌幅超过该值视为价格跳变（约+49%/-33%，仅记录不阻断）
+
+# 组合分析配置
+RISK_FREE_RATE = 0.02  # 年化无风险利率
+ANALYTICS_LOOKBACK_DAYS = 250  # 协方差矩阵使用的交易日数量
+ROLLING_SHARPE_WINDOW = 60  # 滚动夏普比率窗口
+
+# 盘中实时估值配置
+LIVE_POLL_INTERVAL = 15  # 行情轮询间隔（秒）
+LIVE_QUOTE_BATCH_SIZE = 60  # 每次请求的股票数量
+LIVE_EVENT_LIMIT = 200  # 快照文件保留的最近事件数量
+# 北京时间交易时段，按地区（instruments.MARKET_REGIONS）配置
+# 美股按冬令时覆盖到次日05:00，不区分夏令时；周六凌晨的时段按周末处理，不轮询
+LIVE_TRADING_SESSIONS = {
+    'cn': [('09:30', '11:30'), ('13:00', '15:00')],
+    'hk': [('09:30', '12:00'), ('13:00', '16:00')],
+    'us': [('00:00', '05:00'), ('21:30', '24:00')],
+}
+
+# 历史数据保留策略（stock_valuation表和market_trend.json，stock_basic_data不降采样）
+RETENTION_DAILY_MONTHS = 24  # 最近N个月保留每日数据
+RETENTION_WEEKLY_MONTHS = 60  # 其后至N个月保留每周最后一条，更早保留每月最后一条
+RETENTION_VACUUM_DAYS = 30  # 数据库VACUUM间隔天数
+
 # 文件路径配置
 STOCKS_DATA_FILE = os.path.join('data', 'stocks_data.csv')
 POSITION_DATA_FILE = os.path.join('data', 'position.csv')
 TRANSFER_DATA_FILE = os.path.join('data', 'transfer.csv')
 OUTPUT_JSON_DIR = os.path.join('docs', 'data')
+# 持仓报告输出（markdown-README.md, json-报告摘要, html-报告页面）
+REPORT_FORMATS = ['markdown']
+REPORT_MARKDOWN_FILE = 'README.md'
+REPORT_JSON_FILE = os.path.join('docs', 'data', 'portfolio_report.json')
+REPORT_HTML_FILE = os.path.join('docs', 'report.html')
+# 运行锁文件，防止多个任务同时写数据库和输出文件
+RUN_LOCK_FILE = os.path.join('data', 'run.lock')
+
+# HTTP缓存配置（业绩预测页面）
+HTTP_CACHE_DIR = os.path.join('data', 'cache', 'http')
+# 缓存有效期（秒），过期后发送条件请求校验
+HTTP_CACHE_TTL = int(os.environ.get('HTTP_CACHE_TTL', 12 * 3600))
+# online-正常请求, offline-仅回放缓存（测试用）
+HTTP_CACHE_MODE = os.environ.get('HTTP_CACHE_MODE', 'online')
+# 模拟服务器录制的接口响应目录（mock_server.py --record 写入，回放时读取）
+MOCK_RECORDING_DIR = os.path.join('data', 'recordings')
@@ -1,18 +1,31 @@
 # 数据获取模块
 import requests
 import pandas as pd
+import numpy as np
 import sys,time
 import logging
 from datetime import datetime, timedelta
 from io import StringIO
-from config import XUEQIU_API_URL, API_PARAMS, HEADERS, TEN_YEARS_TRADING_DAYS, STOCKS_DATA_FILE
+from config import (XUEQIU_API_URL, API_PARAMS, HEADERS, TEN_YEARS_TRADING_DAYS, STOCKS_DATA_FILE,
+                    THS_BASE_URL, ETNET_BASE_URL)
 from database import StockDatabase
+from http_cache import HttpCache
+from date_utils import timestamps_to_dates
+from instruments import resolve
+
+# 雪球K线需要的字段，按返回的column表头定位
+KLINE_FIELDS = ['timestamp', 'close', 'pe', 'market_capital']
+
+def _nan_to_none(values):
+    """将NaN转换为None，便于写入数据库NULL"""
+    return np.where(np.isnan(values), None, values).tolist()
 
 class StockDataFetcher:
     def __init__(self):
         self.db = StockDatabase()
         self.session = requests.Session()
         self.session.headers.update(HEADERS)
+        self.http_cache = HttpCache()
         
     def get_stock_symbols(self):
         """从CSV文件获取股票代码列表"""
@@ -35,7 +48,7 @@ class StockDataFetcher:
                 count = TEN_YEARS_TRADING_DAYS  # 获取10年数据
 
         params = API_PARAMS.copy()
-        symbol_code = str(symbol).replace("hk", "").replace("HK", "")
+        symbol_code = resolve(symbol).xueqiu_code
         params.update({
             'symbol': symbol_code,
             'count': count
@@ -60,15 +73,21 @@ class StockDataFetcher:
 
     def _stock_profit_forecast(self, symbol):
         """获取股票业绩预测数据"""
-        if symbol.lower().startswith('hk'):
+        instrument = resolve(symbol)
+        if instrument.etnet_code:
             try:
-                url = "https://www.etnet.com.hk/www/sc/stocks/realtime/quote_profit.php"
+                url = f"{ETNET_BASE_URL}/www/sc/stocks/realtime/quote_profit.php"
                 headers = HEADERS.copy()
                 headers['Referer'] = "https://www.etnet.com.hk"
                 params = {
-                    "code": str(symbol).lower().replace("hk", "")
+                    "code": instrument.etnet_code
                 }
-                response = requests.get(url, params=params, headers=headers)
+                response = self.http_cache.fetch(self.session, url, params=params, headers=headers)
+                if response is None:
+                    return None, None, None
+                # 页面内容未变化时直接复用上次的解析结果
+                if not response.changed and response.result:
+                    return tuple(response.result)
                 temp_df = pd.read_html(StringIO(response.text), header=0)[3]
                 last_year_data = temp_df.loc[temp_df.index.max()]
                 last_year = int(last_year_data['财政年度'])
@@ -76,62 +95,85 @@ class StockDataFetcher:
                     last_year_profit_forecast = last_year_data['纯利/(亏损)  (百万元人民币)'] * 1000000  # 转换为元人民币
                 except Exception as e:
                     last_year_profit_forecast = last_year_data['纯利/(亏损)  (百万港元)'] * 1000000  # 转换为元
-                return symbol, last_year, last_year_profit_forecast
+                result = (symbol, last_year, float(last_year_profit_forecast))
+                self.http_cache.save_result(url, params, result)
+                return result
             except Exception as e:
                 logging.error(f"获取{symbol}业绩预测数据失败: {e}")
                 return None, None, None
-        else:
+        elif instrument.ths_code:
             try:
-                symbol_code = str(symbol).lower().replace("sz", "").replace("sh", "")
-                url = f"https://basic.10jqka.com.cn/new/{symbol_code}/worth.html"
+                symbol_code = instrument.ths_code
+                url = f"{THS_BASE_URL}/new/{symbol_code}/worth.html"
                 headers = HEADERS.copy()
                 headers['Referer'] = f"https://basic.10jqka.com.cn/{symbol_code}"
-                response = requests.get(url, headers=headers)
-                response.encoding = "gbk"
+                response = self.http_cache.fetch(self.session, url, headers=headers, encoding="gbk")
+                if response is None:
+                    return None, None, None
+                # 页面内容未变化时直接复用上次的解析结果
+                if not response.changed and response.result:
+                    return tuple(response.result)
                 temp_df = pd.read_html(StringIO(response.text))[1]
                 last_year_data = temp_df.loc[temp_df.index.max()]
                 last_year = int(last_year_data['年度'])
                 last_year_profit_forecast = round((last_year_data['最小值'] + last_year_data['均值']) / 2 * 100000000, 2)  # 取最小值和均值的平均值，并转换为元人民币
-                return symbol, last_year, last_year_profit_forecast
+                result = (symbol, last_year, float(last_year_profit_forecast))
+                self.http_cache.save_result(url, None, result)
+                return result
             except Exception as e:
                 logging.error(f"获取{symbol}业绩预测数据失败: {e}")
                 return None, None, None
+        else:
+            logging.warning(f"{symbol} 所属市场暂无业绩预测数据源")
+            return None, None, None
 
 
     def _parse_api_data(self, symbol, data):
-        """解析API返回的数据"""
-        items = data.get('data', {}).get('item', [])
-        parsed_data = []
-        
-        for item in items[4:]:   # 跳过前4条数据，因为前4条数据是无效数据
-            if len(item) == 14:  # 确保数据格式正确
-                timestamp = item[0]  # 时间戳
-                close = item[5]     # 收盘价
-                pe = item[-2]  # 市盈率
-                market_capital = item[-1]   # 总市值
-                
-                if close and close > 0:  # 确保有效数据
-                    parsed_data.append({
-                        'symbol': symbol,
-                        'timestamp': timestamp,
-                        'close': close,
-                        'pe': pe,
-                        'market_capital': market_capital
-                    })
+        """解析API返回的数据，按column表头定位字段，批量转换为可直接executemany的元组"""
+        payload = data.get('data', {})
+        columns = payload.get('column') or []
+        items = payload.get('item', [])[4:]   # 跳过前4条数据，因为前4条数据是无效数据
+
+        try:
+            index = {name: columns.index(name) for name in KLINE_FIELDS}
+        except ValueError:
+            logging.error(f"{symbol} 返回数据缺少必要字段: {columns}")
+            return []
+
+        # 批量校验行宽，确保数据格式正确
+        rows = [item for item in items if len(item) == len(columns)]
+        if len(rows) != len(items):
+            logging.warning(f"{symbol} 有 {len(items) - len(rows)} 条数据格式不正确，已跳过")
+        if not rows:
+            logging.warning(f"{symbol} 没有可解析的数据")
+            return []
+
+        # None转换为NaN，按列整体计算；收盘价无效等异常在入库时校验并隔离
+        matrix = np.array(rows, dtype=float)
+        close = matrix[:, index['close']]
+        timestamps = matrix[:, index['timestamp']].astype('int64')
+        pe = matrix[:, index['pe']]
+        market_capital = matrix[:, index['market_capital']]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares_outstanding = np.where(close > 0, market_capital / close, np.nan)
+
+        trade_dates = timestamps_to_dates(timestamps).tolist()
+        parsed_data = list(zip(
+            [symbol] * len(timestamps),
+            timestamps.tolist(),
+            _nan_to_none(close),
+            _nan_to_none(pe),
+            _nan_to_none(market_capital),
+            _nan_to_none(shares_outstanding),
+            trade_dates
+        ))
 
-        logging.info(f"解析到 {len(parsed_data)} 条 {symbol}的数据 - 最新 { self.db.timestamp_to_datetime(parsed_data[-1]['timestamp']) }")
+        logging.info(f"解析到 {len(parsed_data)} 条 {symbol}的数据 - 最新 { trade_dates[-1] if trade_dates else '-' }")
         return parsed_data
 
     def save_to_database(self, stock_data):
         """保存数据到数据库"""
-        for data in stock_data:
-            self.db.insert_stock_data(
-                data['symbol'],
-                data['timestamp'],
-                data['close'],
-                data['pe'],
-                data['market_capital']
-            )
+        self.db.insert_stock_data_batch(stock_data)
             
     def fetch_all_stocks_data(self, delay=1):
         """获取所有股票数据"""
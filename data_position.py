@@ -3,27 +3,24 @@ import json
 import requests
 import logging
 from datetime import datetime
-from config import POSITION_DATA_FILE, TRANSFER_DATA_FILE, OUTPUT_JSON_DIR
-
-# 根据股票代码判断市场前缀
-def get_market_prefix(stock_code):
-    # 如果是港股（代码以 "hk" 开头）
-    if stock_code.lower().startswith("hk"):
-        return "hk"
-    # A 股代码：以 6 开头为上海，其它为深圳
-    return 'sh' if stock_code.startswith("6") else 'sz'
+from config import (POSITION_DATA_FILE, TRANSFER_DATA_FILE, OUTPUT_JSON_DIR, TENCENT_QUOTE_BASE_URL,
+                    EXCHANGE_RATE_BASE_URL)
+from artifacts import atomic_write_json
+from instruments import resolve
 
 # 调用腾讯股票接口获取实时数据
 def fetch_stock_data(stock_code):
+    try:
+        instrument = resolve(stock_code)
+    except ValueError as e:
+        # 无法识别的代码只跳过该持仓，不影响其他持仓和报告生成
+        logging.error(f"Error fetching data for {stock_code}: {e}")
+        return None, None
     # 现金持仓（代码 000000），定为当前价为1，涨跌幅为0%
-    if stock_code == "000000":
+    if instrument.market == "CASH":
         return 1.0, 0.0
 
-    market = get_market_prefix(stock_code)
-    clean_code = stock_code
-    if market == "hk":
-        clean_code = stock_code[2:]  # 去除 "hk" 前缀
-    url = f"https://qt.gtimg.cn/q={market}{clean_code}"
+    url = f"{TENCENT_QUOTE_BASE_URL}/q={instrument.tencent_code}"
     try:
         response = requests.get(url, timeout=5)
         if response.status_code == 200:
@@ -49,11 +46,48 @@ def fetch_stock_data(stock_code):
         logging.error(f"Error fetching data for {stock_code}: {e}")
     return None, None
 
-def fetch_hk_exchange_rate():
+# 批量调用腾讯股票接口，一次请求获取多个股票的行情
+def fetch_stock_quotes(quote_codes, session=None):
+    """quote_codes 为带市场前缀的代码列表，如 ['sh600519', 'hk00700']，返回 {代码: (当前价, 今日涨跌幅)}"""
+    quotes = {}
+    if not quote_codes:
+        return quotes
+    url = f"{TENCENT_QUOTE_BASE_URL}/q={','.join(quote_codes)}"
+    try:
+        response = (session or requests).get(url, timeout=5)
+        if response.status_code != 200:
+            logging.error(f"批量获取行情失败: HTTP {response.status_code}")
+            return quotes
+        # 每行一个股票：v_sh600519="...~...";
+        for line in response.text.split(';'):
+            name_start = line.find('v_')
+            start = line.find('="')
+            end = line.rfind('"')
+            if name_start == -1 or start == -1 or end <= start:
+                continue
+            parts = line[start+2:end].split('~')
+            try:
+                current_price = float(parts[3])
+            except (IndexError, ValueError):
+                continue
+            try:
+                today_change = float(parts[32])
+            except (IndexError, ValueError):
+                today_change = 0.0
+            quotes[line[name_start+2:start]] = (current_price, today_change)
+    except Exception as e:
+        logging.error(f"批量获取行情失败: {e}")
+    return quotes
+
+# 非人民币计价地区的币种，以及汇率接口不可用时使用的兑人民币汇率
+REGION_CURRENCIES = {"hk": "HKD", "us": "USD"}
+DEFAULT_CNY_RATES = {"HKD": 0.85, "USD": 7.1}
+
+def fetch_exchange_rate(currency="HKD"):
     """
-    从 API 接口获取实时的港币兑人民币汇率
+    从 API 接口获取实时的外币兑人民币汇率
     """
-    url = "https://api.exchangerate-api.com/v4/latest/HKD"
+    url = f"{EXCHANGE_RATE_BASE_URL}/v4/latest/{currency}"
     try:
         response = requests.get(url, timeout=5)
         if response.status_code == 200:
@@ -61,13 +95,13 @@ def fetch_hk_exchange_rate():
             rate = data.get("rates", {}).get("CNY")
             return rate
     except Exception as e:
-        logging.error("Error fetching HKD to CNY exchange rate:", e)
-    return 0.85
+        logging.error(f"Error fetching {currency} to CNY exchange rate: {e}")
+    return DEFAULT_CNY_RATES[currency]
 
 def process_positions():
     positions = []
     portfolio_total_value = 0.0
-    hk_rate = fetch_hk_exchange_rate()  # 从API接口中获取实时的港币兑人民币汇率
+    cny_rates = {}  # 按需从API接口中获取实时的外币兑人民币汇率，每种币种只请求一次
 
     # 读取 position.csv 中的持仓数据
     with open(POSITION_DATA_FILE, newline='', encoding="utf-8") as csvfile:
@@ -87,10 +121,13 @@ def process_positions():
             profit_loss = (current_price - cost_price) * quantity
             profit_loss_rate = ((current_price - cost_price) / cost_price * 100) if cost_price != 0 else 0.0
             
-            # 如果是港股，将市值和盈亏数据从港币转换为人民币
-            if stock_code.lower().startswith("hk"):
-                market_value = market_value * hk_rate
-                profit_loss = profit_loss * hk_rate
+            # 港股、美股的市值和盈亏数据从港币、美元转换为人民币
+            currency = REGION_CURRENCIES.get(resolve(stock_code).region)
+            if currency:
+                if currency not in cny_rates:
+                    cny_rates[currency] = fetch_exchange_rate(currency)
+                market_value = market_value * cny_rates[currency]
+                profit_loss = profit_loss * cny_rates[currency]
 
             portfolio_total_value += market_value
             portfolio_total_value = round(portfolio_total_value, 2)
@@ -129,8 +166,7 @@ def process_positions():
     }
 
     # 保存当前持仓数据到 current_position.json
-    with open(f"{OUTPUT_JSON_DIR}/current_position.json", "w", encoding="utf-8") as jsonfile:
-        json.dump(result, jsonfile, ensure_ascii=False, indent=4)
+    atomic_write_json(f"{OUTPUT_JSON_DIR}/current_position.json", result, indent=4)
 
     # 更新每日市值趋势数据到 market_trend.json
     const_today = datetime.now().strftime("%Y-%m-%d")
@@ -180,8 +216,11 @@ def process_positions():
 
     # 排序后写入文件
     trend_data.sort(key=lambda record: datetime.strptime(record.get("date"), "%Y-%m-%d"))
-    with open(f"{OUTPUT_JSON_DIR}/market_trend.json", "w", encoding="utf-8") as trend_file:
-        json.dump(trend_data, trend_file, ensure_ascii=False, indent=4)
+    atomic_write_json(f"{OUTPUT_JSON_DIR}/market_trend.json", trend_data, indent=4)
+
+    return result
 
 if __name__ == "__main__":
-    process_positions() 
\ No newline at end of file
+    from artifacts import run_lock
+    with run_lock():
+        process_positions() 
\ No newline at end of file
@@ -1,37 +1,69 @@
 # 数据处理模块
 import pandas as pd
-import numpy as np
 import json
 import logging
-import os,sys
+import textwrap
+from collections import deque
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 from datetime import datetime
-from config import OUTPUT_JSON_DIR, STOCKS_DATA_FILE
+from config import (OUTPUT_JSON_DIR, STOCKS_DATA_FILE, BUY_POINT_PE_THRESHOLD, HIGH_PE_DISCOUNT,
+                    LOW_PE_DISCOUNT, FUTURE_PE_FACTOR)
 from database import StockDatabase
+from artifacts import StagedOutput
+from valuation_rules import valuation_bucket
+
+# 首页索引包含的字段和预排序字段
+DASHBOARD_FIELDS = [
+    'symbol', 'name', 'date', 'current_close', 'current_pe', 'reasonable_pe', 'pe_valuation',
+    'net_profit_valuation', 'pe_buy_point', 'profit_buy_point', 'pe_percentile_90', 'predicted_net_profit_billion'
+]
+DASHBOARD_SORT_FIELDS = ['pe_valuation', 'net_profit_valuation']
+# 首页走势图的点数
+DASHBOARD_SPARKLINE_POINTS = 60
+# 估值结果每批写入数据库的股票数量
+VALUATION_WRITE_BATCH_SIZE = 50
+# 多进程计算时每个工作进程分到的分片数，分片越小负载越均衡
+SHARDS_PER_WORKER = 4
+
+# 工作进程中的处理器实例，由_init_worker创建
+_WORKER_PROCESSOR = None
 
 class StockDataProcessor:
-    def __init__(self):
-        self.db = StockDatabase()
+    def __init__(self, db=None, std_multiples=None):
+        self.db = db or StockDatabase()
+        self._std_multiples = std_multiples
+
+    @property
+    def std_multiples(self):
+        """各股票的市盈率标准差倍数，只读取一次CSV"""
+        if self._std_multiples is None:
+            symbols_df = pd.read_csv(STOCKS_DATA_FILE)
+            self._std_multiples = dict(zip(symbols_df['股票代码'], symbols_df['市盈率标准差倍数']))
+        return self._std_multiples
         
     def calculate_valuation_metrics(self, symbol):
         """计算股票估值指标"""
         # 获取股票数据
-        stock_data = self.db.get_stock_data_by_symbol(symbol, limit=2500)  # 获取约10年数据
+        # 最近约10年数据中通过入库校验的交易日（PE、市值有效）
+        stock_data = self.db.get_clean_stock_data(symbol, window=2500)
         stock_profit_forecast = self.db.get_latest_profit_forecast(symbol)
-        symbols_df = pd.read_csv(STOCKS_DATA_FILE)
-        symbols_std_pe_args = symbols_df[symbols_df['股票代码']==symbol]['市盈率标准差倍数'].iloc[0]
-        if not stock_data or len(stock_data) < 1000:  # 至少需要4年数据
+        symbols_std_pe_args = self.std_multiples[symbol]
+        if not stock_data:
             logging.warning(f"股票 {symbol} 数据不足，跳过计算")
             return None
+        if not stock_profit_forecast:
+            logging.warning(f"股票 {symbol} 缺少业绩预测，跳过计算")
+            return None
 
         # 转换为DataFrame
         df = pd.DataFrame(stock_data, columns=[
-            'symbol', 'timestamp', 'close', 'pe', 'market_capital', 'shares_outstanding'
+            'symbol', 'timestamp', 'close', 'pe', 'market_capital', 'shares_outstanding', 'trade_date'
         ])
-        
-        # 确保PE数据有效
-        df = df[df['pe'].notna() & (df['pe'] > 0)]
 
-        if len(df) < 1000:
+        if len(df) < 1000:  # 至少需要4年数据
             logging.warning(f"股票 {symbol} - {len(df)} 有效PE数据不足,跳过计算")
             return None
 
@@ -57,19 +89,19 @@ class StockDataProcessor:
         
         # 根据预测利润,计算三年后的市值,三年后的市盈率为当前合理市盈率的8折,和当前市值的百分比值
         predicted_net_profit = stock_profit_forecast[2]  # 单位：元
-        net_profit_valuation = current_market_cap / (reasonable_pe * 0.8 * predicted_net_profit)
+        net_profit_valuation = current_market_cap / (reasonable_pe * FUTURE_PE_FACTOR * predicted_net_profit)
         
         # 使用市盈率计算买点
-        if reasonable_pe >= 20:
-            pe_buy_point = current_close / pe_valuation * 0.5
+        if reasonable_pe >= BUY_POINT_PE_THRESHOLD:
+            pe_buy_point = current_close / pe_valuation * HIGH_PE_DISCOUNT
         else:
-            pe_buy_point = current_close / pe_valuation * 0.6
+            pe_buy_point = current_close / pe_valuation * LOW_PE_DISCOUNT
         
         # 使用净利润估值计算买点
-        if reasonable_pe >= 20:
-            profit_buy_point = (current_close / net_profit_valuation) * 0.5 
+        if reasonable_pe >= BUY_POINT_PE_THRESHOLD:
+            profit_buy_point = (current_close / net_profit_valuation) * HIGH_PE_DISCOUNT 
         else:
-            profit_buy_point = (current_close / net_profit_valuation) * 0.6
+            profit_buy_point = (current_close / net_profit_valuation) * LOW_PE_DISCOUNT
 
         result = {
             'symbol': symbol,
@@ -86,100 +118,174 @@ class StockDataProcessor:
             'profit_buy_point': round(profit_buy_point, 2),
             'predicted_net_profit': predicted_net_profit,
             'profit_date': stock_profit_forecast[3],
-            'calculation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'calculation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'trade_date': latest_data['trade_date']
         }
         logging.info(f"完成 {symbol} 的估值计算")
         return result
         
-    def process_all_stocks(self):
-        """处理所有股票数据"""
-        symbols_df = pd.read_csv('data/stocks_data.csv')
+    def process_all_stocks(self, workers=1, save=True):
+        """处理所有股票数据
+
+        workers>1时将股票列表分片到进程池并行计算，结果流式返回主进程，
+        由主进程单独批量写入估值表，避免多个进程争抢SQLite写锁
+        """
+        symbols_df = pd.read_csv(STOCKS_DATA_FILE)
         symbols = symbols_df['股票代码'].tolist()
         
         results = []
-        successful_count = 0
+        pending = []
         
-        logging.info(f"开始处理 {len(symbols)} 个股票的估值计算")
+        logging.info(f"开始处理 {len(symbols)} 个股票的估值计算（{workers} 个进程）")
         
-        for symbol in symbols:
-            result = self.calculate_valuation_metrics(symbol)
-            if result:
-                # 保存到数据库
-                self.db.save_valuation_result(result)
-                    
-                results.append(result)
-                successful_count += 1
-
-        logging.info(f"估值计算完成，成功处理 {successful_count}/{len(symbols)} 个股票")
+        for result in self._iter_results(symbols, workers):
+            if not result:
+                continue
+            results.append(result)
+            if save:
+                pending.append(result)
+                if len(pending) >= VALUATION_WRITE_BATCH_SIZE:
+                    # 保存到数据库
+                    self.db.save_valuation_results(pending)
+                    pending = []
+        if pending:
+            self.db.save_valuation_results(pending)
+
+        # 并行计算时结果按完成顺序返回，恢复为CSV中的顺序
+        position = {symbol: i for i, symbol in enumerate(symbols)}
+        results.sort(key=lambda result: position[result['symbol']])
+
+        logging.info(f"估值计算完成，成功处理 {len(results)}/{len(symbols)} 个股票")
         return results
 
+    def _iter_results(self, symbols, workers):
+        """逐个返回股票的估值计算结果"""
+        if workers <= 1:
+            for symbol in symbols:
+                yield self.calculate_valuation_metrics(symbol)
+            return
+
+        shard_count = min(len(symbols), workers * SHARDS_PER_WORKER)
+        shards = [symbols[i::shard_count] for i in range(shard_count)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.db.db_path, self.std_multiples)) as executor:
+            futures = [executor.submit(_calculate_shard, shard) for shard in shards]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def _format_valuation(self, data, name):
+        """补充导出字段：日期、股票名称、以亿元为单位的预测利润"""
+        # 优先使用入库时计算的交易日期，旧数据才转换时间戳
+        if not data.get('date'):
+            data['date'] = self.db.timestamp_to_datetime(data['timestamp'])
+        data['name'] = name
+        # 计算时间为运行时刻，不导出，数据未变化时导出文件内容保持不变
+        data.pop('calculation_date', None)
+        # 转换预测利润单位为亿元（如果存在）
+        if data['predicted_net_profit']:
+            data['predicted_net_profit_billion'] = round(data['predicted_net_profit'] / 100000000, 2)
+        return data
+
+    def _iter_formatted(self, rows, name, sparkline):
+        """格式化导出字段，同时记录最近的市盈率估值走势"""
+        for data in rows:
+            self._format_valuation(data, name)
+            sparkline.append(data['pe_valuation'])
+            yield data
+
     def save_to_json(self):
-        """保存结果为JSON文件,从数据库估值表查询数据"""
+        """保存结果为JSON文件,从数据库估值表按股票代码流式读取，每个股票读完即写出"""
         os.makedirs(OUTPUT_JSON_DIR, exist_ok=True)
         
-        # 从数据库查询所有估值数据
-        valuation_data = self.db.get_all_valuation_data()
-        
-        if not valuation_data:
-            logging.warning("数据库中没有估值数据")
-            return
-        
         # 读取股票代码顺序
         symbols_df = pd.read_csv(STOCKS_DATA_FILE)
         symbol_order = symbols_df['股票代码'].tolist()
+        symbol_names = dict(zip(symbols_df['股票代码'], symbols_df['股票名称']))
         
-        # 按股票代码分组，并按照CSV文件中的顺序排序
-        grouped_results = {}
-        for data in valuation_data:
-            symbol = data['symbol']
-            if symbol not in grouped_results:
-                grouped_results[symbol] = []
-            grouped_results[symbol].append(data)
-        
-        # 按照CSV文件中的股票代码顺序保存数据
-        for symbol in symbol_order:
-            if symbol in grouped_results:
-                data_list = grouped_results[symbol]
-                # 按时间戳从前往后排序
-                data_list.sort(key=lambda x: x['timestamp'])
-                
-                # 转换时间戳为日期格式，预测利润单位转换为亿元
-                for data in data_list:
-                    # 转换时间戳为日期格式
-                    data['date'] = self.db.timestamp_to_datetime(data['timestamp'])
-                    data['name'] = symbols_df[symbols_df['股票代码']==symbol]['股票名称'].iloc[0]
-                    # 转换预测利润单位为亿元（如果存在）
-                    if data['predicted_net_profit']:
-                        data['predicted_net_profit_billion'] = round(data['predicted_net_profit'] / 100000000, 2)
-                
-                filename = os.path.join(OUTPUT_JSON_DIR, f"{symbol}_valuation.json")
+        # 所有文件先写入暂存目录，全部成功后再替换，避免中途失败留下不完整的JSON
+        with StagedOutput(OUTPUT_JSON_DIR) as staged:
+            # 逐个股票写出历史估值文件，只保留每个股票的最新一条和走势点用于汇总
+            latest_by_symbol = {}
+            sparklines = {}
+            for symbol, rows in groupby(self.db.iter_valuation_data(), key=itemgetter('symbol')):
+                if symbol not in symbol_names:
+                    continue
+                sparkline = deque(maxlen=DASHBOARD_SPARKLINE_POINTS)
+                filename = staged.path(f"{symbol}_valuation.json")
                 with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(data_list, f, ensure_ascii=False, indent=2)
-        
-        # 保存所有股票的最新估值数据，按照CSV文件中的顺序
-        all_stocks_latest = []
-        for symbol in symbol_order:
-            if symbol in grouped_results:
-                data_list = grouped_results[symbol]
-                # 获取每个股票的最新数据（时间戳最大的）
-                latest_data = max(data_list, key=lambda x: x['timestamp'])
-                # 转换时间戳为日期格式
-                latest_data['date'] = self.db.timestamp_to_datetime(latest_data['timestamp'])
-                data['name'] = symbols_df[symbols_df['股票代码']==symbol]['股票名称'].iloc[0]
-                # 转换预测利润单位为亿元（如果存在）
-                if latest_data['predicted_net_profit']:
-                    latest_data['predicted_net_profit_billion'] = round(latest_data['predicted_net_profit'] / 100000000, 2)
-                all_stocks_latest.append(latest_data)
-        
-        summary_file = os.path.join(OUTPUT_JSON_DIR, "all_stocks_valuation.json")
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(all_stocks_latest, f, ensure_ascii=False, indent=2)
-        
-        # 保存更新时间
-        update_time = {"date":datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        create_time_file = os.path.join(OUTPUT_JSON_DIR, "last_date.json")
-        with open(create_time_file, 'w', encoding='utf-8') as f:
-            json.dump(update_time, f, ensure_ascii=False, indent=2)
+                    latest_by_symbol[symbol] = dump_json_array(
+                        self._iter_formatted(rows, symbol_names[symbol], sparkline), f
+                    )
+                sparklines[symbol] = list(sparkline)
+            
+            if not latest_by_symbol:
+                logging.warning("数据库中没有估值数据")
+                return
+            
+            # 保存所有股票的最新估值数据，按照CSV文件中的顺序
+            all_stocks_latest = [latest_by_symbol[symbol] for symbol in symbol_order if symbol in latest_by_symbol]
+            
+            summary_file = staged.path("all_stocks_valuation.json")
+            with open(summary_file, 'w', encoding='utf-8') as f:
+                json.dump(all_stocks_latest, f, ensure_ascii=False, indent=2)
+            
+            # 保存数据日期（最新交易日），不使用运行时刻，数据未变化时文件内容不变
+            update_time = {"date": max(data['date'] for data in all_stocks_latest)}
+            create_time_file = staged.path("last_date.json")
+            with open(create_time_file, 'w', encoding='utf-8') as f:
+                json.dump(update_time, f, ensure_ascii=False, indent=2)
+
+            # 保存首页使用的精简索引
+            dashboard_index = build_dashboard_index(all_stocks_latest, sparklines, update_time['date'])
+            index_file = staged.path("dashboard_index.json")
+            with open(index_file, 'w', encoding='utf-8') as f:
+                json.dump(dashboard_index, f, ensure_ascii=False, separators=(',', ':'))
 
         logging.info(f"估值结果已保存到 {OUTPUT_JSON_DIR} 目录")
-        logging.info(f"共处理 {len(grouped_results)} 个股票的估值数据，按照CSV文件顺序保存")
\ No newline at end of file
+        logging.info(f"共处理 {len(latest_by_symbol)} 个股票的估值数据，按照CSV文件顺序保存")
+
+
+def _init_worker(db_path, std_multiples):
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = StockDataProcessor(StockDatabase(db_path, create_tables=False), std_multiples)
+
+
+def _calculate_shard(symbols):
+    """在工作进程中计算一个分片的估值，只读数据库"""
+    return [_WORKER_PROCESSOR.calculate_valuation_metrics(symbol) for symbol in symbols]
+
+
+def dump_json_array(items, f, indent=2):
+    """将可迭代对象逐项写为JSON数组，格式与json.dump(list, indent=indent)一致，返回最后一项"""
+    last = None
+    f.write('[')
+    for item in items:
+        f.write(',\n' if last is not None else '\n')
+        f.write(textwrap.indent(json.dumps(item, ensure_ascii=False, indent=indent), ' ' * indent))
+        last = item
+    f.write('\n]' if last is not None else ']')
+    return last
+
+
+def build_dashboard_index(latest_rows, sparklines, update_time):
+    """生成首页精简索引：按字段列表存储的行数据、预排序顺序、估值分组和走势点"""
+    rows = [[data.get(field) for field in DASHBOARD_FIELDS] for data in latest_rows]
+
+    # 预排序（升序），首页降序时倒序使用；空值按0处理，与前端排序规则一致
+    order = {
+        field: sorted(range(len(latest_rows)), key=lambda i, f=field: latest_rows[i].get(f) or 0)
+        for field in DASHBOARD_SORT_FIELDS
+    }
+
+    buckets = {}
+    for i, data in enumerate(latest_rows):
+        buckets.setdefault(valuation_bucket(data), []).append(i)
+
+    return {
+        'update_time': update_time,
+        'fields': DASHBOARD_FIELDS,
+        'rows': rows,
+        'order': order,
+        'buckets': buckets,
+        'sparklines': [sparklines.get(data['symbol'], []) for data in latest_rows],
+    }
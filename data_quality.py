@@ -0,0 +1,103 @@
+# 数据质量校验模块
+import sys
+import logging
+import argparse
+import numpy as np
+from config import QUALITY_MAX_PE, QUALITY_MAX_LOG_RETURN
+
+# 异常类型；阻断类异常的交易日不进入 stock_clean_data 视图
+# 重复时间戳只保留最后一条写入，本身不影响统计，仅记录备查
+# 价格跳变仅记录备查：K线为前复权价格，除权后新数据与旧复权基准的历史数据相比会出现跳变，
+# 而市盈率不受复权影响；港股无涨跌幅限制、新股上市等也会出现正常的大幅波动
+QUARANTINE_REASONS = {
+    'duplicate_timestamp': False,
+    'invalid_close': True,
+    'invalid_pe': True,
+    'absurd_pe': True,
+    'invalid_market_capital': True,
+    'price_jump': False,
+}
+
+
+def find_anomalies(timestamps, close, pe, market_capital, prev_close=None):
+    """向量化检测一个股票的K线异常
+
+    输入为同一股票按写入顺序排列的数组（缺失值为NaN），prev_close为数据库中该批数据之前最后一个收盘价。
+    返回(写入掩码, 异常列表[(下标, 原因, 数值)])：收盘价无效和被后续重复数据覆盖的行不写入
+    """
+    timestamps = np.asarray(timestamps, dtype='int64')
+    close = np.asarray(close, dtype=float)
+    pe = np.asarray(pe, dtype=float)
+    market_capital = np.asarray(market_capital, dtype=float)
+    n = len(timestamps)
+    anomalies = []
+    if n == 0:
+        return np.zeros(0, dtype=bool), anomalies
+
+    def flag(mask, reason, values):
+        for i in np.flatnonzero(mask):
+            value = values[i]
+            anomalies.append((int(i), reason, None if np.isnan(value) else float(value)))
+
+    # 同一时间戳出现多次时保留最后一条（与INSERT OR REPLACE一致）
+    _, last_index = np.unique(timestamps[::-1], return_index=True)
+    duplicate = np.ones(n, dtype=bool)
+    duplicate[n - 1 - last_index] = False
+    flag(duplicate, 'duplicate_timestamp', close)
+
+    invalid_close = ~(close > 0)
+    flag(invalid_close & ~duplicate, 'invalid_close', close)
+    keep = ~duplicate & ~invalid_close
+
+    flag(keep & ~(pe > 0), 'invalid_pe', pe)
+    flag(keep & (pe > QUALITY_MAX_PE), 'absurd_pe', pe)
+    flag(keep & ~(market_capital > 0), 'invalid_market_capital', market_capital)
+
+    # 按时间排序后与前一交易日收盘价比较，对数涨跌幅过大视为除权等导致的价格跳变
+    kept = np.flatnonzero(keep)
+    kept = kept[np.argsort(timestamps[kept], kind='stable')]
+    if len(kept):
+        previous = np.concatenate(([prev_close if prev_close and prev_close > 0 else np.nan], close[kept][:-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_return = np.abs(np.log(close[kept] / previous))
+        jump = np.zeros(n, dtype=bool)
+        jump[kept] = log_return > QUALITY_MAX_LOG_RETURN
+        returns = np.full(n, np.nan)
+        returns[kept] = close[kept] / previous - 1
+        flag(jump, 'price_jump', returns)
+
+    return keep, anomalies
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='股票基础数据质量校验')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    revalidate_parser = subparsers.add_parser('revalidate', help='按当前规则重新校验已入库的历史数据')
+    revalidate_parser.add_argument('--symbol', action='append', help='只校验指定股票，可重复指定')
+    subparsers.add_parser('report', help='按股票和异常类型统计隔离记录')
+    args = parser.parse_args()
+
+    from database import StockDatabase
+    db = StockDatabase()
+
+    if args.command == 'revalidate':
+        from artifacts import run_lock
+        with run_lock():
+            counts = db.revalidate_stock_data(args.symbol)
+        logging.info(f"重新校验完成: {sum(counts.values())} 条异常记录，涉及 {len(counts)} 个股票")
+        return 0
+
+    rows = db.get_quarantine_summary()
+    if not rows:
+        print("没有隔离的异常数据")
+        return 0
+    print(f"{'股票代码':<12}{'异常类型':<26}{'记录数':>8}  最近日期")
+    for symbol, reason, count, last_date in rows:
+        print(f"{symbol:<12}{reason:<26}{count:>8}  {last_date or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
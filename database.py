@@ -1,21 +1,96 @@
 # 数据库模块
+import json
 import sqlite3
 import logging
 from datetime import datetime
-import pytz
-from config import DB_PATH
+from config import DB_PATH, beijing_tz
 import os,sys
 
+# 等待其他连接释放写锁的秒数
+SQLITE_BUSY_TIMEOUT = 30
+
+# 基础数据批量写入字段
+BASIC_DATA_COLUMNS = [
+    'symbol', 'timestamp', 'close', 'pe', 'market_capital', 'shares_outstanding', 'trade_date'
+]
+
+# 估值表查询字段（与导出JSON的字段顺序一致）
+VALUATION_COLUMNS = [
+    'symbol', 'timestamp', 'current_close', 'current_pe', 'avg_pe_5y', 'std_pe_5y',
+    'pe_percentile_90', 'reasonable_pe', 'pe_valuation', 'net_profit_valuation',
+    'pe_buy_point', 'profit_buy_point', 'predicted_net_profit', 'profit_date', 'calculation_date'
+]
+
+# 估值表写入字段，预测利润和交易日期允许缺失
+VALUATION_INSERT_COLUMNS = VALUATION_COLUMNS + ['trade_date']
+VALUATION_OPTIONAL_COLUMNS = {'predicted_net_profit', 'profit_date', 'trade_date'}
+
+
+def _upsert_sql(table, columns, key_columns, ignored_columns=()):
+    """生成按唯一键写入的SQL：已有记录只在数值变化时更新（不删除重建，id不变）
+
+    重复写入相同数据时不修改任何页面，数据未变化时数据库文件保持不变
+    """
+    updated = [column for column in columns if column not in key_columns]
+    compared = [column for column in updated if column not in ignored_columns]
+    return f'''
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET
+        {', '.join(f'{column} = excluded.{column}' for column in updated)}
+        WHERE {' OR '.join(f'{column} IS NOT excluded.{column}' for column in compared)}
+    '''
+
+
+def _changed_rows(cursor, table, columns, key_columns, rows, ignored_columns=()):
+    """过滤出新增或数值有变化的行
+
+    即使UPSERT最终没有修改记录，插入尝试也会推进AUTOINCREMENT序号，因此写入前先排除未变化的行
+    """
+    compared = [column for column in columns if column not in key_columns and column not in ignored_columns]
+    key_index = [columns.index(column) for column in key_columns]
+    compared_index = [columns.index(column) for column in compared]
+    query = f'''
+        SELECT {', '.join(compared)} FROM {table}
+        WHERE {' AND '.join(f'{column} = ?' for column in key_columns)}
+    '''
+    changed = []
+    for row in rows:
+        existing = cursor.execute(query, [row[i] for i in key_index]).fetchone()
+        if existing is None or existing != tuple(row[i] for i in compared_index):
+            changed.append(row)
+    return changed
+
+
+BASIC_DATA_UPSERT_SQL = _upsert_sql('stock_basic_data', BASIC_DATA_COLUMNS, ['symbol', 'timestamp'])
+# 计算时间只随估值结果一起更新，重复计算得到相同结果时不改写
+VALUATION_INSERT_SQL = _upsert_sql('stock_valuation', VALUATION_INSERT_COLUMNS, ['symbol', 'timestamp'],
+                                   ignored_columns={'calculation_date'})
+QUARANTINE_COLUMNS = ['symbol', 'timestamp', 'trade_date', 'reason', 'value', 'blocking']
+QUARANTINE_UPSERT_SQL = _upsert_sql('stock_data_quarantine', QUARANTINE_COLUMNS, ['symbol', 'timestamp', 'reason'])
+
 class StockDatabase:
-    def __init__(self):
-        self.db_path = DB_PATH
-        self._create_tables()
+    def __init__(self, db_path=DB_PATH, create_tables=True):
+        self.db_path = db_path
+        # 多进程计算的工作进程只读数据，不需要建表（避免争抢写锁）
+        if create_tables:
+            self._create_tables()
         
+    def _begin_immediate(self):
+        """打开连接并以BEGIN IMMEDIATE开始事务
+
+        事务开始时即获取写锁，并发运行时后来者等待而不是在提交时失败，
+        多表更新要么全部提交要么全部回滚
+        """
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
     def _create_tables(self):
         """创建数据库表"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._begin_immediate()
         cursor = conn.cursor()
         
         # 创建股票基础数据表
@@ -29,10 +104,15 @@ class StockDatabase:
                 market_capital REAL,
                 shares_outstanding REAL,
                 created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                trade_date TEXT,  -- 北京时间交易日期，入库时计算
                 UNIQUE(symbol, timestamp)
             )
         ''')
+        self._add_trade_date_column(cursor, 'stock_basic_data')
         
+        # 旧版估值表的唯一键包含profit_date，需要迁移
+        self._rename_legacy_table(cursor, 'stock_valuation', 'UNIQUE(symbol, timestamp, profit_date)')
+
         # 创建股票估值结果表（支持历史记录）
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS stock_valuation (
@@ -52,87 +132,324 @@ class StockDatabase:
                 predicted_net_profit REAL,
                 profit_date TEXT,
                 calculation_date TEXT NOT NULL,
-                UNIQUE(symbol, timestamp, profit_date)
+                trade_date TEXT,
+                UNIQUE(symbol, timestamp)
             )
         ''')
-        
-        # 创建股票业绩预测表（支持历史记录）
+        self._migrate_valuation_unique_key(cursor)
+        self._add_trade_date_column(cursor, 'stock_valuation')
+
+        # 旧版业绩预测表按获取日期逐日存储，需要迁移为区间存储
+        self._rename_legacy_table(cursor, 'stock_profit_forecast', 'forecast_date TEXT NOT NULL')
+
+        # 创建股票业绩预测表（按变化存储，valid_to为NULL表示当前有效）
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS stock_profit_forecast (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 symbol TEXT NOT NULL,
                 forecast_year INTEGER NOT NULL,
                 forecast_net_profit REAL NOT NULL,
-                forecast_date TEXT NOT NULL,  -- 预测数据获取日期
+                valid_from TEXT NOT NULL,  -- 预测值生效日期（首次获取到该值的日期）
+                valid_to TEXT,  -- 预测值失效日期（不含）
                 created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol, forecast_year, forecast_date)
+                UNIQUE(symbol, valid_from, forecast_year)
             )
         ''')
-        
+
+        # 每个股票每个年度只有一条当前有效的预测
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_profit_forecast_current
+            ON stock_profit_forecast(symbol, forecast_year) WHERE valid_to IS NULL
+        ''')
+        self._migrate_profit_forecast_ranges(cursor)
+
+        # 创建数据质量隔离表（入库时检测到的异常，按股票、时间戳、原因存储）
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_data_quarantine'")
+        quarantine_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_data_quarantine (
+                symbol TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                trade_date TEXT,
+                reason TEXT NOT NULL,
+                value REAL,
+                blocking INTEGER NOT NULL,  -- 1表示该交易日不参与估值统计
+                detected_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (symbol, timestamp, reason)
+            ) WITHOUT ROWID
+        ''')
+
+        # 通过校验的基础数据视图，估值计算直接使用，无需再过滤
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS stock_clean_data AS
+            SELECT b.* FROM stock_basic_data b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM stock_data_quarantine q
+                WHERE q.symbol = b.symbol AND q.timestamp = b.timestamp AND q.blocking = 1
+            )
+        ''')
+        if not quarantine_exists:
+            # 首次创建隔离表时校验已有的历史数据
+            self._revalidate(cursor)
+        else:
+            # 异常类型是否阻断可能随规则调整，已有隔离记录按当前规则同步
+            from data_quality import QUARANTINE_REASONS
+            cursor.executemany(
+                'UPDATE stock_data_quarantine SET blocking = ? WHERE reason = ? AND blocking != ?',
+                [(int(blocking), reason, int(blocking)) for reason, blocking in QUARANTINE_REASONS.items()]
+            )
+
         conn.commit()
         conn.close()
         logging.info("数据库表创建完成")
         
-    def insert_stock_data(self, symbol, timestamp, close, pe, market_capital):
-        """插入股票基础数据"""
+    def _rename_legacy_table(self, cursor, table, legacy_marker):
+        """旧版表结构重命名为<table>_old，等待新表创建后迁移数据"""
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        row = cursor.fetchone()
+        if row and legacy_marker in row[0]:
+            logging.info(f"检测到旧版表结构，开始迁移: {table}")
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
 
-        conn = sqlite3.connect(self.db_path)
+    def _legacy_table_exists(self, cursor, table):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{table}_old',))
+        return cursor.fetchone() is not None
+
+    def _migrate_valuation_unique_key(self, cursor):
+        """估值表唯一键由(symbol, timestamp, profit_date)改为(symbol, timestamp)，同一交易日只保留最新记录"""
+        if not self._legacy_table_exists(cursor, 'stock_valuation'):
+            return
+        cursor.execute('''
+            INSERT OR REPLACE INTO stock_valuation
+            (id, symbol, timestamp, current_close, current_pe, avg_pe_5y, std_pe_5y,
+            pe_percentile_90, reasonable_pe, pe_valuation, net_profit_valuation,
+            pe_buy_point, profit_buy_point, predicted_net_profit, profit_date, calculation_date)
+            SELECT id, symbol, timestamp, current_close, current_pe, avg_pe_5y, std_pe_5y,
+            pe_percentile_90, reasonable_pe, pe_valuation, net_profit_valuation,
+            pe_buy_point, profit_buy_point, predicted_net_profit, profit_date, calculation_date
+            FROM stock_valuation_old
+            WHERE id IN (SELECT MAX(id) FROM stock_valuation_old GROUP BY symbol, timestamp)
+        ''')
+        cursor.execute('DROP TABLE stock_valuation_old')
+        logging.info("估值表唯一键迁移完成")
+
+    def _migrate_profit_forecast_ranges(self, cursor):
+        """将逐日存储的业绩预测合并为valid_from/valid_to区间"""
+        if not self._legacy_table_exists(cursor, 'stock_profit_forecast'):
+            return
+        cursor.execute('''
+            SELECT symbol, forecast_year, forecast_net_profit, forecast_date
+            FROM stock_profit_forecast_old
+            ORDER BY symbol, forecast_year, forecast_date
+        ''')
+        rows = cursor.fetchall()
+
+        # 连续相同的预测值合并为一个区间，值变化时关闭上一个区间
+        ranges = []
+        for symbol, forecast_year, forecast_net_profit, forecast_date in rows:
+            last = ranges[-1] if ranges else None
+            if last and last[0] == symbol and last[1] == forecast_year:
+                if self._same_forecast(last[2], forecast_net_profit):
+                    continue
+                last[4] = forecast_date
+            ranges.append([symbol, forecast_year, forecast_net_profit, forecast_date, None])
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO stock_profit_forecast
+            (symbol, forecast_year, forecast_net_profit, valid_from, valid_to)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ranges)
+        cursor.execute('DROP TABLE stock_profit_forecast_old')
+        logging.info(f"业绩预测表迁移完成: {len(rows)} 条记录合并为 {len(ranges)} 个区间")
+
+    def _add_trade_date_column(self, cursor, table):
+        """为旧表补充trade_date列，并批量回填历史数据
+
+        回填只在添加列时执行一次（与建表在同一事务中提交），之后写入的数据入库时已计算交易日期
+        """
+        cursor.execute(f'PRAGMA table_info({table})')
+        if 'trade_date' in [row[1] for row in cursor.fetchall()]:
+            return
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN trade_date TEXT')
+
+        cursor.execute(f'SELECT DISTINCT timestamp FROM {table} WHERE trade_date IS NULL')
+        timestamps = [row[0] for row in cursor.fetchall()]
+        if not timestamps:
+            return
+
+        from date_utils import timestamps_to_dates
+        dates = timestamps_to_dates(timestamps).tolist()
+        cursor.executemany(
+            f'UPDATE {table} SET trade_date = ? WHERE timestamp = ? AND trade_date IS NULL',
+            zip(dates, timestamps)
+        )
+        logging.info(f"{table} 回填交易日期完成，共 {len(timestamps)} 个交易日")
+
+    @staticmethod
+    def _same_forecast(a, b):
+        """比较两个预测净利润是否相同（精确到分）"""
+        return round(a, 2) == round(b, 2)
+
+    def insert_stock_data(self, symbol, timestamp, close, pe, market_capital, trade_date=None):
+        """插入单条股票基础数据，与批量插入一样经过数据质量校验"""
+        shares_outstanding = market_capital / close if close and market_capital and close > 0 else 0
+        if trade_date is None:
+            trade_date = self.timestamp_to_datetime(timestamp)
+        self.insert_stock_data_batch([
+            (symbol, timestamp, close, pe, market_capital, shares_outstanding, trade_date)
+        ])
+
+    def insert_stock_data_batch(self, rows):
+        """批量插入股票基础数据，rows为BASIC_DATA_COLUMNS顺序的元组
+
+        写入前逐个股票做数据质量校验：收盘价无效或被重复覆盖的行不写入，异常记录写入隔离表
+        """
+        conn = self._begin_immediate()
         cursor = conn.cursor()
-        
+
         try:
-            shares_outstanding = market_capital / close if close and close > 0 else 0
-            cursor.execute('''
-                INSERT OR REPLACE INTO stock_basic_data 
-                (symbol, timestamp, close, pe, market_capital, shares_outstanding)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (symbol, timestamp, close, pe, market_capital, shares_outstanding))
-            
+            accepted = []
+            quarantine = []
+            for symbol, symbol_rows in self._group_by_symbol(rows).items():
+                # 与数据库中该批数据之前的最后一个收盘价比较，检测价格跳变
+                cursor.execute('''
+                    SELECT close FROM stock_basic_data
+                    WHERE symbol = ? AND timestamp < ?
+                    ORDER BY timestamp DESC LIMIT 1
+                ''', (symbol, min(row[1] for row in symbol_rows)))
+                previous = cursor.fetchone()
+                keep, symbol_quarantine = self._validate_rows(symbol, symbol_rows, previous[0] if previous else None)
+                accepted.extend(row for row, ok in zip(symbol_rows, keep) if ok)
+                quarantine.extend(symbol_quarantine)
+
+                # 重新获取的交易日按最新数据重新判定，删除不再成立的异常记录
+                reasons = {(symbol, row[1]): [] for row in symbol_rows}
+                for record in symbol_quarantine:
+                    reasons[(symbol, record[1])].append(record[3])
+                cursor.executemany('''
+                    DELETE FROM stock_data_quarantine
+                    WHERE symbol = ? AND timestamp = ? AND reason NOT IN (SELECT value FROM json_each(?))
+                ''', [(symbol, timestamp, json.dumps(r)) for (_, timestamp), r in reasons.items()])
+
+            cursor.executemany(BASIC_DATA_UPSERT_SQL, _changed_rows(
+                cursor, 'stock_basic_data', BASIC_DATA_COLUMNS, ['symbol', 'timestamp'], accepted
+            ))
+            self._insert_quarantine(cursor, quarantine)
             conn.commit()
-            # logging.info(f"成功插入数据: {symbol} - {self.timestamp_to_datetime(timestamp)} - {timestamp}")
+            if quarantine:
+                logging.warning(f"数据校验发现 {len(quarantine)} 条异常，已写入隔离表")
         except Exception as e:
-            logging.error(f"插入数据失败: {e} {symbol} - {timestamp} - {close} - {pe} - {market_capital}")
+            logging.error(f"批量插入数据失败: {e}")
             conn.rollback()
         finally:
             conn.close()
-            
-    def save_valuation_result(self, valuation_data):
-        """保存估值结果（支持历史记录）"""
+
+    @staticmethod
+    def _group_by_symbol(rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[0], []).append(row)
+        return groups
+
+    @staticmethod
+    def _validate_rows(symbol, rows, prev_close=None):
+        """校验一个股票的基础数据行，返回(写入掩码, 隔离记录)"""
+        from data_quality import find_anomalies, QUARANTINE_REASONS
+        # None按NaN处理
+        _, timestamps, close, pe, market_capital = list(zip(*rows))[:5]
+        keep, anomalies = find_anomalies(timestamps, close, pe, market_capital, prev_close)
+        quarantine = [
+            (symbol, rows[i][1], rows[i][6], reason, value, int(QUARANTINE_REASONS[reason]))
+            for i, reason, value in anomalies
+        ]
+        return keep, quarantine
+
+    @staticmethod
+    def _insert_quarantine(cursor, quarantine):
+        cursor.executemany(QUARANTINE_UPSERT_SQL, quarantine)
+
+    def _revalidate(self, cursor, symbols=None):
+        """按当前规则重新校验已入库的历史数据，返回{股票代码: 异常记录数}
+
+        收盘价无效的数据从未入库，保留其隔离记录
+        """
+        if symbols is None:
+            cursor.execute('SELECT DISTINCT symbol FROM stock_basic_data')
+            symbols = [row[0] for row in cursor.fetchall()]
+        counts = {}
+        for symbol in symbols:
+            cursor.execute(f'''
+                SELECT {', '.join(BASIC_DATA_COLUMNS)} FROM stock_basic_data
+                WHERE symbol = ? ORDER BY timestamp
+            ''', (symbol,))
+            rows = cursor.fetchall()
+            cursor.execute(
+                "DELETE FROM stock_data_quarantine WHERE symbol = ? AND reason != 'invalid_close'", (symbol,)
+            )
+            if not rows:
+                continue
+            _, quarantine = self._validate_rows(symbol, rows)
+            self._insert_quarantine(cursor, quarantine)
+            if quarantine:
+                counts[symbol] = len(quarantine)
+        if counts:
+            logging.info(f"历史数据校验完成: {sum(counts.values())} 条异常记录，涉及 {len(counts)} 个股票")
+        return counts
+
+    def revalidate_stock_data(self, symbols=None):
+        """按当前规则重新校验历史数据（调整校验规则后使用）"""
+        conn = self._begin_immediate()
+        try:
+            counts = self._revalidate(conn.cursor(), symbols)
+            conn.commit()
+            return counts
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_quarantine_summary(self):
+        """按股票和异常类型统计隔离记录"""
         conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute('''
+                SELECT symbol, reason, COUNT(*), MAX(trade_date)
+                FROM stock_data_quarantine
+                GROUP BY symbol, reason
+                ORDER BY symbol, reason
+            ''').fetchall()
+        finally:
+            conn.close()
+
+    def save_valuation_results(self, batch):
+        """批量保存估值结果，一个事务写入多个股票"""
+        if not batch:
+            return
+        conn = self._begin_immediate()
         cursor = conn.cursor()
-        
+
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO stock_valuation 
-                (symbol, timestamp, current_close, current_pe, avg_pe_5y, std_pe_5y, 
-                pe_percentile_90, reasonable_pe, pe_valuation, net_profit_valuation,
-                pe_buy_point, profit_buy_point, predicted_net_profit, profit_date, calculation_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
-                valuation_data['symbol'],
-                valuation_data['timestamp'],
-                valuation_data['current_close'],
-                valuation_data['current_pe'],
-                valuation_data['avg_pe_5y'],
-                valuation_data['std_pe_5y'],
-                valuation_data['pe_percentile_90'],
-                valuation_data['reasonable_pe'],
-                valuation_data['pe_valuation'],
-                valuation_data['net_profit_valuation'],
-                valuation_data['pe_buy_point'],
-                valuation_data['profit_buy_point'],
-                valuation_data.get('predicted_net_profit'),
-                valuation_data.get('profit_date'),
-                valuation_data['calculation_date']
-            ))
-            
+            rows = _changed_rows(cursor, 'stock_valuation', VALUATION_INSERT_COLUMNS, ['symbol', 'timestamp'],
+                                 [self._valuation_row(data) for data in batch], ignored_columns={'calculation_date'})
+            cursor.executemany(VALUATION_INSERT_SQL, rows)
             conn.commit()
-            logging.info(f"成功保存估值结果: {valuation_data['symbol']} - {valuation_data['calculation_date']}")
+            logging.info(f"成功保存 {len(batch)} 个股票的估值结果（{len(rows)} 个有变化）")
         except Exception as e:
-            logging.error(f"保存估值结果失败: {e}")
+            logging.error(f"批量保存估值结果失败: {e}")
             conn.rollback()
             sys.exit(1)
         finally:
             conn.close()
 
+    @staticmethod
+    def _valuation_row(valuation_data):
+        """估值结果字典转换为VALUATION_INSERT_COLUMNS顺序的元组"""
+        return tuple(
+            valuation_data.get(column) if column in VALUATION_OPTIONAL_COLUMNS else valuation_data[column]
+            for column in VALUATION_INSERT_COLUMNS
+        )
+
             
     def get_stock_data_by_symbol(self, symbol, limit=None):
         """根据股票代码获取数据"""
@@ -140,7 +457,7 @@ class StockDatabase:
         cursor = conn.cursor()
         
         query = '''
-            SELECT symbol, timestamp, close, pe, market_capital, shares_outstanding
+            SELECT symbol, timestamp, close, pe, market_capital, shares_outstanding, trade_date
             FROM stock_basic_data 
             WHERE symbol = ? 
             ORDER BY timestamp DESC
@@ -155,6 +472,35 @@ class StockDatabase:
         
         return results
         
+    def get_clean_stock_data(self, symbol, window=None):
+        """获取最近window个交易日中通过数据质量校验的基础数据，格式与get_stock_data_by_symbol一致"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        query = '''
+            SELECT symbol, timestamp, close, pe, market_capital, shares_outstanding, trade_date
+            FROM stock_clean_data
+            WHERE symbol = ?
+        '''
+        params = [symbol]
+        if window:
+            query += '''
+            AND timestamp >= (
+                SELECT MIN(timestamp) FROM (
+                    SELECT timestamp FROM stock_basic_data WHERE symbol = ?
+                    ORDER BY timestamp DESC LIMIT ?
+                )
+            )
+            '''
+            params += [symbol, window]
+        query += ' ORDER BY timestamp DESC'
+
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+        conn.close()
+
+        return results
+
     def check_symbol_exists(self, symbol):
         """检查股票代码是否存在"""
         conn = sqlite3.connect(self.db_path)
@@ -167,17 +513,47 @@ class StockDatabase:
         return count > 0
 
     def save_profit_forecast(self, symbol, forecast_year, forecast_net_profit, forecast_date):
-        """保存股票业绩预测数据（插入或更新）"""
-        conn = sqlite3.connect(self.db_path)
+        """保存股票业绩预测数据，仅在预测值变化时新增记录"""
+        conn = self._begin_immediate()
         cursor = conn.cursor()
 
         try:
-            # 使用INSERT OR REPLACE语句，自动处理插入或更新
+            # 网站切换到新的预测年度后，较早年度的预测不再更新，关闭其未结束的区间
             cursor.execute('''
-                INSERT OR REPLACE INTO stock_profit_forecast 
-                (symbol, forecast_year, forecast_net_profit, forecast_date)
-                VALUES (?, ?, ?, ?)
-            ''', (symbol, forecast_year, forecast_net_profit, forecast_date))
+                UPDATE stock_profit_forecast SET valid_to = MAX(valid_from, ?)
+                WHERE symbol = ? AND forecast_year < ? AND valid_to IS NULL
+            ''', (forecast_date, symbol, forecast_year))
+            closed = cursor.rowcount
+
+            cursor.execute('''
+                SELECT id, forecast_net_profit, valid_from
+                FROM stock_profit_forecast
+                WHERE symbol = ? AND forecast_year = ? AND valid_to IS NULL
+            ''', (symbol, forecast_year))
+            current = cursor.fetchone()
+
+            if current and self._same_forecast(current[1], forecast_net_profit):
+                if closed:
+                    conn.commit()
+                logging.info(f"业绩预测数据未变化: {symbol} - {forecast_year} - 自 {current[2]} 起有效")
+                return
+
+            if current and current[2] >= forecast_date:
+                # 同一天重复获取且数值变化，直接覆盖当天的记录
+                cursor.execute('''
+                    UPDATE stock_profit_forecast SET forecast_net_profit = ? WHERE id = ?
+                ''', (forecast_net_profit, current[0]))
+            else:
+                if current:
+                    # 关闭上一个区间
+                    cursor.execute('''
+                        UPDATE stock_profit_forecast SET valid_to = ? WHERE id = ?
+                    ''', (forecast_date, current[0]))
+                cursor.execute('''
+                    INSERT INTO stock_profit_forecast
+                    (symbol, forecast_year, forecast_net_profit, valid_from)
+                    VALUES (?, ?, ?, ?)
+                ''', (symbol, forecast_year, forecast_net_profit, forecast_date))
             
             conn.commit()
             logging.info(f"成功保存业绩预测数据: {symbol} - {forecast_year} - {forecast_date}")
@@ -189,41 +565,40 @@ class StockDatabase:
             conn.close()
             
     def get_profit_forecast_by_symbol(self, symbol, forecast_date=None):
-        """根据股票代码获取业绩预测数据，可指定预测日期"""
+        """根据股票代码获取业绩预测数据，指定日期时返回该日期有效的预测"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         if forecast_date:
             cursor.execute('''
-                SELECT symbol, forecast_year, forecast_net_profit, forecast_date, created_time
+                SELECT symbol, forecast_year, forecast_net_profit, valid_from, created_time
                 FROM stock_profit_forecast 
-                WHERE symbol = ? AND forecast_date = ?
+                WHERE symbol = ? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)
                 ORDER BY forecast_year DESC
-            ''', (symbol, forecast_date))
+            ''', (symbol, forecast_date, forecast_date))
         else:
             cursor.execute('''
-                SELECT symbol, forecast_year, forecast_net_profit, forecast_date, created_time
+                SELECT symbol, forecast_year, forecast_net_profit, valid_from, created_time
                 FROM stock_profit_forecast 
                 WHERE symbol = ? 
-                ORDER BY forecast_date DESC, forecast_year DESC
+                ORDER BY valid_from DESC, forecast_year DESC
             ''', (symbol,))
         
         results = cursor.fetchall()
         conn.close()
         return results
-        
 
-            
     def get_latest_profit_forecast(self, symbol):
         """获取股票最新的业绩预测数据"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        # 走(symbol, valid_from, forecast_year)唯一索引倒序查找
         cursor.execute('''
-            SELECT symbol, forecast_year, forecast_net_profit, forecast_date, created_time
+            SELECT symbol, forecast_year, forecast_net_profit, valid_from, created_time
             FROM stock_profit_forecast 
             WHERE symbol = ? 
-            ORDER BY forecast_date DESC, forecast_year DESC
+            ORDER BY valid_from DESC, forecast_year DESC
             LIMIT 1
         ''', (symbol,))
         
@@ -231,15 +606,30 @@ class StockDatabase:
         conn.close()
         return result
 
+    def get_profit_forecast_as_of(self, symbol, as_of_date):
+        """获取指定日期有效的最新业绩预测数据"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT symbol, forecast_year, forecast_net_profit, valid_from, created_time
+            FROM stock_profit_forecast
+            WHERE symbol = ? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)
+            ORDER BY valid_from DESC, forecast_year DESC
+            LIMIT 1
+        ''', (symbol, as_of_date, as_of_date))
+
+        result = cursor.fetchone()
+        conn.close()
+        return result
+
     def get_all_valuation_data(self):
         """从数据库估值表查询所有数据"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT symbol, timestamp, current_close, current_pe, avg_pe_5y, std_pe_5y,
-                   pe_percentile_90, reasonable_pe, pe_valuation, net_profit_valuation,
-                   pe_buy_point, profit_buy_point, predicted_net_profit, profit_date, calculation_date
+        cursor.execute(f'''
+            SELECT {', '.join(VALUATION_COLUMNS)}
             FROM stock_valuation 
             ORDER BY symbol, timestamp DESC
         ''')
@@ -248,43 +638,29 @@ class StockDatabase:
         conn.close()
         
         # 转换为字典格式
-        valuation_data = []
-        for row in results:
-            data = {
-                'symbol': row[0],
-                'timestamp': row[1],
-                'current_close': row[2],
-                'current_pe': row[3],
-                'avg_pe_5y': row[4],
-                'std_pe_5y': row[5],
-                'pe_percentile_90': row[6],
-                'reasonable_pe': row[7],
-                'pe_valuation': row[8],
-                'net_profit_valuation': row[9],
-                'pe_buy_point': row[10],
-                'profit_buy_point': row[11],
-                'predicted_net_profit': row[12],
-                'profit_date': row[13],
-                'calculation_date': row[14]
-            }
-            valuation_data.append(data)
-        
-        return valuation_data
+        return [dict(zip(VALUATION_COLUMNS, row)) for row in results]
+
+    def iter_valuation_data(self):
+        """按股票代码、时间戳升序逐行读取估值数据，内存占用与历史长度无关
+
+        入库时已计算的交易日期以date字段返回，导出时无需再转换时间戳
+        """
+        columns = VALUATION_COLUMNS + ['date']
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(f'''
+                SELECT {', '.join(VALUATION_COLUMNS)}, trade_date
+                FROM stock_valuation
+                ORDER BY symbol, timestamp
+            ''')
+            for row in cursor:
+                yield dict(zip(columns, row))
+        finally:
+            conn.close()
 
     def timestamp_to_datetime(self, timestamp_ms):
         """将毫秒级时间戳转换为北京时间格式"""
-        # 转换为秒（浮点数）
-        timestamp_sec = timestamp_ms / 1000.0
-        
-        # 创建UTC时间对象
-        utc_time = datetime.utcfromtimestamp(timestamp_sec)
-        
-        # 设置时区为UTC
-        utc_time = utc_time.replace(tzinfo=pytz.utc)
-        
-        # 转换为北京时间
-        beijing_tz = pytz.timezone('Asia/Shanghai')
-        beijing_time = utc_time.astimezone(beijing_tz)
+        beijing_time = datetime.fromtimestamp(timestamp_ms / 1000.0, tz=beijing_tz)
         
         # 格式化输出
         return beijing_time.strftime("%Y-%m-%d")
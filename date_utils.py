@@ -0,0 +1,30 @@
+# 日期转换工具模块
+from datetime import datetime
+import numpy as np
+from config import beijing_tz
+
+
+# 北京时间最后一次夏令时于1991年结束，此后UTC偏移固定
+FIXED_OFFSET_SINCE_MS = int(datetime(1992, 1, 1, tzinfo=beijing_tz).timestamp() * 1000)
+
+
+def _utc_offset_ms(timestamp_ms):
+    """北京时区在指定时间戳的UTC偏移（毫秒）"""
+    offset = datetime.fromtimestamp(timestamp_ms / 1000.0, tz=beijing_tz).utcoffset()
+    return int(offset.total_seconds() * 1000)
+
+
+def timestamps_to_dates(timestamps_ms):
+    """批量将毫秒级时间戳转换为北京时间日期字符串(YYYY-MM-DD)，返回numpy字符串数组"""
+    ts = np.asarray(timestamps_ms, dtype='int64')
+    if ts.size == 0:
+        return np.array([], dtype='<U10')
+
+    # 1992年以后北京时间没有夏令时，整体加同一个偏移即可；更早的数据可能跨越夏令时区间，逐条计算
+    # （首尾偏移相同不能说明中间没有夏令时，如1986-1991年每年夏季）
+    if ts.min() >= FIXED_OFFSET_SINCE_MS:
+        local_ms = ts + _utc_offset_ms(int(ts.min()))
+    else:
+        local_ms = ts + np.array([_utc_offset_ms(int(t)) for t in ts], dtype='int64')
+
+    return local_ms.astype('datetime64[ms]').astype('datetime64[D]').astype(str)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+估值计算黄金数据回归工具
+从数据库冻结一份基础数据和业绩预测的快照，用冻结的参考实现生成黄金结果，
+校验当前（或改写后的）估值计算与黄金结果在容差内一致，并统计两者耗时
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import importlib
+import statistics
+from datetime import datetime
+import pandas as pd
+from artifacts import atomic_write_json
+from config import (DB_PATH, STOCKS_DATA_FILE, BUY_POINT_PE_THRESHOLD, HIGH_PE_DISCOUNT, LOW_PE_DISCOUNT,
+                    FUTURE_PE_FACTOR)
+
+GOLDEN_DIR = os.path.join('data', 'golden')
+GOLDEN_FIXTURE_DB = os.path.join(GOLDEN_DIR, 'valuation_fixture.db')
+GOLDEN_RESULTS_FILE = os.path.join(GOLDEN_DIR, 'valuation_golden.json')
+# 快照包含的表，只复制选中股票的数据
+FIXTURE_TABLES = ['stock_basic_data', 'stock_data_quarantine', 'stock_profit_forecast']
+# 仓库中提交的模拟快照和黄金结果（tests/test_golden_valuation.py使用）
+SYNTHETIC_FIXTURE_DIR = os.path.join('tests', 'fixtures')
+SYNTHETIC_FIXTURE_DB = os.path.join(SYNTHETIC_FIXTURE_DIR, 'valuation_fixture.db')
+SYNTHETIC_GOLDEN_FILE = os.path.join(SYNTHETIC_FIXTURE_DIR, 'valuation_golden.json')
+SYNTHETIC_BEGIN_MS = 1760716800000  # 2025-10-18 北京时间
+# (股票代码, 交易日数, 市盈率标准差倍数, 预测净利润)；交易日数不足1000或没有业绩预测的股票不计算估值
+SYNTHETIC_STOCKS = [
+    ('SH600519', 1300, 1.0, 9.0e10),
+    ('SZ000568', 1300, 0.5, 1.5e10),
+    ('HK00700', 1300, 1.5, 2.0e11),
+    ('SH603259', 600, 1.0, 1.0e10),
+    ('SZ000858', 1300, 1.0, None),
+]
+# 不参与比较的字段
+IGNORED_FIELDS = {'calculation_date'}
+# 默认容差：导出字段保留两位小数，允许一次舍入方向不同
+DEFAULT_ABS_TOL = 0.01
+DEFAULT_REL_TOL = 1e-9
+
+# 参考实现使用的查询和窗口，冻结为当前版本，不随估值计算的优化修改
+REFERENCE_WINDOW = 2500
+REFERENCE_MIN_ROWS = 1000
+REFERENCE_RECENT_ROWS = 1250
+REFERENCE_DATA_SQL = '''
+    SELECT symbol, timestamp, close, pe, market_capital, shares_outstanding, trade_date
+    FROM stock_clean_data
+    WHERE symbol = ?
+    AND timestamp >= (
+        SELECT MIN(timestamp) FROM (
+            SELECT timestamp FROM stock_basic_data WHERE symbol = ?
+            ORDER BY timestamp DESC LIMIT ?
+        )
+    )
+    ORDER BY timestamp DESC
+'''
+REFERENCE_FORECAST_SQL = '''
+    SELECT symbol, forecast_year, forecast_net_profit, valid_from, created_time
+    FROM stock_profit_forecast
+    WHERE symbol = ?
+    ORDER BY valid_from DESC, forecast_year DESC
+    LIMIT 1
+'''
+
+
+def reference_valuation_metrics(conn, symbol, std_multiple):
+    """估值计算的参考实现（StockDataProcessor.calculate_valuation_metrics的冻结副本）
+
+    只用于生成黄金结果和耗时对比，请勿为性能修改
+    """
+    stock_data = conn.execute(REFERENCE_DATA_SQL, (symbol, symbol, REFERENCE_WINDOW)).fetchall()
+    stock_profit_forecast = conn.execute(REFERENCE_FORECAST_SQL, (symbol,)).fetchone()
+    if not stock_data or not stock_profit_forecast:
+        return None
+
+    df = pd.DataFrame(stock_data, columns=[
+        'symbol', 'timestamp', 'close', 'pe', 'market_capital', 'shares_outstanding', 'trade_date'
+    ])
+    if len(df) < REFERENCE_MIN_ROWS:
+        return None
+
+    latest_data = df.iloc[0]
+    current_pe = latest_data['pe']
+    current_close = latest_data['close']
+    current_market_cap = latest_data['market_capital']
+
+    five_year_data = df.head(REFERENCE_RECENT_ROWS)
+    avg_pe_5y = five_year_data['pe'].mean()
+    std_pe_5y = five_year_data['pe'].std()
+    pe_percentile_90 = df['pe'].quantile(0.9)
+    reasonable_pe = ((avg_pe_5y - std_pe_5y * std_multiple) + avg_pe_5y) / 2
+    pe_valuation = current_pe / reasonable_pe if reasonable_pe > 0 else 0
+
+    predicted_net_profit = stock_profit_forecast[2]
+    net_profit_valuation = current_market_cap / (reasonable_pe * FUTURE_PE_FACTOR * predicted_net_profit)
+
+    discount = HIGH_PE_DISCOUNT if reasonable_pe >= BUY_POINT_PE_THRESHOLD else LOW_PE_DISCOUNT
+    pe_buy_point = current_close / pe_valuation * discount
+    profit_buy_point = (current_close / net_profit_valuation) * discount
+
+    return {
+        'symbol': symbol,
+        'timestamp': int(latest_data['timestamp']),
+        'current_close': current_close,
+        'current_pe': current_pe,
+        'avg_pe_5y': round(avg_pe_5y, 2),
+        'std_pe_5y': round(std_pe_5y, 2),
+        'pe_percentile_90': round(pe_percentile_90, 2),
+        'reasonable_pe': round(reasonable_pe, 2),
+        'pe_valuation': round(pe_valuation, 2),
+        'net_profit_valuation': round(net_profit_valuation, 2),
+        'pe_buy_point': round(pe_buy_point, 2),
+        'profit_buy_point': round(profit_buy_point, 2),
+        'predicted_net_profit': predicted_net_profit,
+        'profit_date': stock_profit_forecast[3],
+        'trade_date': latest_data['trade_date'],
+    }
+
+
+def reference_engine(fixture_db, std_multiples):
+    """参考实现的计算函数，接口与估值引擎一致：symbol -> 结果字典"""
+    conn = sqlite3.connect(fixture_db)
+    return lambda symbol: reference_valuation_metrics(conn, symbol, std_multiples[symbol])
+
+
+def processor_engine(fixture_db, std_multiples):
+    """当前估值计算：StockDataProcessor.calculate_valuation_metrics"""
+    from database import StockDatabase
+    from data_processor import StockDataProcessor
+    processor = StockDataProcessor(StockDatabase(fixture_db, create_tables=False), std_multiples)
+    return processor.calculate_valuation_metrics
+
+
+def load_engine(spec):
+    """按 模块:工厂函数 加载估值引擎，工厂函数参数为(快照数据库路径, 标准差倍数字典)"""
+    if not spec:
+        return processor_engine
+    module_name, _, factory_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), factory_name or 'make_engine')
+
+
+def run_engine(engine, symbol):
+    """运行估值计算，结果转换为JSON可保存的普通类型；计算异常直接抛出，不作为预期结果"""
+    result = engine(symbol)
+    if result is None:
+        return None
+    return {key: value.item() if hasattr(value, 'item') else value
+            for key, value in result.items() if key not in IGNORED_FIELDS}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_fixture_symbols(fixture_db):
+    """快照中的股票代码及其市盈率标准差倍数"""
+    conn = sqlite3.connect(fixture_db)
+    try:
+        rows = conn.execute('SELECT symbol, std_multiple FROM fixture_symbols ORDER BY rowid').fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+def load_fixture_data_date(fixture_db):
+    """快照中最新的交易日期"""
+    conn = sqlite3.connect(fixture_db)
+    try:
+        return conn.execute('SELECT MAX(trade_date) FROM stock_basic_data').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def freeze_fixture(source_db=DB_PATH, fixture_db=GOLDEN_FIXTURE_DB, symbols=None):
+    """从数据库复制选中股票的基础数据、隔离记录和业绩预测到快照数据库，返回股票数量"""
+    from database import StockDatabase
+
+    with open(STOCKS_DATA_FILE, newline='', encoding='utf-8') as f:
+        stocks = [(row['股票代码'], row['股票名称'], float(row['市盈率标准差倍数'])) for row in csv.DictReader(f)]
+    if symbols:
+        stocks = [stock for stock in stocks if stock[0] in set(symbols)]
+    if not stocks:
+        raise ValueError("没有可冻结的股票")
+
+    os.makedirs(os.path.dirname(fixture_db) or '.', exist_ok=True)
+    if os.path.exists(fixture_db):
+        os.remove(fixture_db)
+    StockDatabase(fixture_db)
+
+    conn = sqlite3.connect(fixture_db)
+    try:
+        conn.execute('ATTACH DATABASE ? AS src', (source_db,))
+        conn.execute('''
+            CREATE TABLE fixture_symbols (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                std_multiple REAL NOT NULL
+            )
+        ''')
+        conn.executemany('INSERT INTO fixture_symbols (symbol, name, std_multiple) VALUES (?, ?, ?)', stocks)
+        placeholders = ', '.join('?' * len(stocks))
+        for table in FIXTURE_TABLES:
+            # 旧库迁移后列顺序可能不同，按列名复制
+            columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+            conn.execute(f'''
+                INSERT INTO main.{table} ({columns})
+                SELECT {columns} FROM src.{table} WHERE symbol IN ({placeholders})
+            ''', [stock[0] for stock in stocks])
+        conn.commit()
+        conn.execute('DETACH DATABASE src')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    logging.info(f"快照已保存到 {fixture_db}，共 {len(stocks)} 个股票")
+    return len(stocks)
+
+
+def build_synthetic_fixture(fixture_db=SYNTHETIC_FIXTURE_DB):
+    """用模拟服务器的确定性K线生成小型快照，覆盖正常计算、异常数据隔离、数据不足和缺少预测等情况"""
+    from database import StockDatabase
+    from mock_server import synth_kline
+    from date_utils import timestamps_to_dates
+
+    os.makedirs(os.path.dirname(fixture_db) or '.', exist_ok=True)
+    if os.path.exists(fixture_db):
+        os.remove(fixture_db)
+    db = StockDatabase(fixture_db)
+
+    for symbol, days, std_multiple, forecast in SYNTHETIC_STOCKS:
+        items = synth_kline(symbol, SYNTHETIC_BEGIN_MS, days)['data']['item']
+        timestamps = [item[0] for item in items]
+        trade_dates = timestamps_to_dates(timestamps).tolist()
+        rows = [(symbol, item[0], item[5], item[12], item[13], item[13] / item[5], trade_date)
+                for item, trade_date in zip(items, trade_dates)]
+        # 每个股票注入一条负市盈率数据，确认估值计算使用通过校验的数据
+        row = rows[len(rows) // 2]
+        rows[len(rows) // 2] = row[:3] + (-row[3],) + row[4:]
+        db.insert_stock_data_batch(rows)
+        if forecast:
+            db.save_profit_forecast(symbol, 2027, forecast, trade_dates[-1])
+
+    conn = sqlite3.connect(fixture_db)
+    try:
+        conn.execute('''
+            CREATE TABLE fixture_symbols (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                std_multiple REAL NOT NULL
+            )
+        ''')
+        conn.executemany('INSERT INTO fixture_symbols (symbol, name, std_multiple) VALUES (?, ?, ?)',
+                         [(symbol, symbol, std_multiple) for symbol, _, std_multiple, _ in SYNTHETIC_STOCKS])
+        # 入库时间取自快照数据而不是当前时间，重复生成的快照和黄金结果不变
+        data_date = conn.execute('SELECT MAX(trade_date) FROM stock_basic_data').fetchone()[0]
+        conn.execute('UPDATE stock_basic_data SET created_time = ?', (data_date,))
+        conn.execute('UPDATE stock_data_quarantine SET detected_time = ?', (data_date,))
+        conn.execute('UPDATE stock_profit_forecast SET created_time = ?', (data_date,))
+        conn.commit()
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    logging.info(f"模拟快照已保存到 {fixture_db}，共 {len(SYNTHETIC_STOCKS)} 个股票")
+    return len(SYNTHETIC_STOCKS)
+
+
+def record_golden(fixture_db=GOLDEN_FIXTURE_DB, golden_file=GOLDEN_RESULTS_FILE):
+    """使用参考实现计算快照中所有股票的估值，保存为黄金结果"""
+    std_multiples = load_fixture_symbols(fixture_db)
+    engine = reference_engine(fixture_db, std_multiples)
+    # 只包含由快照推导的字段，结果不变时重新生成不改动文件
+    golden = {
+        'fixture_sha256': file_sha256(fixture_db),
+        'data_date': load_fixture_data_date(fixture_db),
+        'results': {symbol: run_engine(engine, symbol) for symbol in std_multiples},
+    }
+    atomic_write_json(golden_file, golden, indent=2)
+    logging.info(f"黄金结果已保存到 {golden_file}，共 {len(golden['results'])} 个股票")
+    return golden
+
+
+def compare_results(expected, actual, abs_tol=DEFAULT_ABS_TOL, rel_tol=DEFAULT_REL_TOL):
+    """比较一个股票的估值结果，返回差异列表[(字段, 期望值, 实际值)]"""
+    if expected is None or actual is None:
+        return [] if expected == actual else [('result', expected, actual)]
+
+    differences = []
+    for field in sorted(set(expected) | set(actual)):
+        a, b = expected.get(field), actual.get(field)
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)) and \
+                not isinstance(a, bool) and not isinstance(b, bool):
+            # 浮点误差之外允许abs_tol的舍入差异
+            if not math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol + 1e-9):
+                differences.append((field, a, b))
+        elif a != b:
+            differences.append((field, a, b))
+    return differences
+
+
+def check_engine(engine_factory, fixture_db=GOLDEN_FIXTURE_DB, golden_file=GOLDEN_RESULTS_FILE,
+                 abs_tol=DEFAULT_ABS_TOL, rel_tol=DEFAULT_REL_TOL):
+    """校验估值引擎与黄金结果一致，返回{股票代码: 差异列表}（只包含有差异的股票）"""
+    with open(golden_file, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    if golden['fixture_sha256'] != file_sha256(fixture_db):
+        raise ValueError(f"快照 {fixture_db} 与黄金结果不匹配，请重新执行record")
+
+    std_multiples = load_fixture_symbols(fixture_db)
+    engine = engine_factory(fixture_db, std_multiples)
+    mismatches = {}
+    for symbol, expected in golden['results'].items():
+        differences = compare_results(expected, run_engine(engine, symbol), abs_tol, rel_tol)
+        if differences:
+            mismatches[symbol] = differences
+    return mismatches
+
+
+def time_engine(engine_factory, fixture_db, std_multiples, repeat):
+    """对快照中所有股票运行repeat轮估值计算，返回耗时中位数（秒）"""
+    engine = engine_factory(fixture_db, std_multiples)
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for symbol in std_multiples:
+            run_engine(engine, symbol)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def benchmark(engine_factory, fixture_db=GOLDEN_FIXTURE_DB, repeat=5):
+    """对比参考实现与估值引擎的耗时"""
+    std_multiples = load_fixture_symbols(fixture_db)
+    reference_seconds = time_engine(reference_engine, fixture_db, std_multiples, repeat)
+    engine_seconds = time_engine(engine_factory, fixture_db, std_multiples, repeat)
+    return {
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'symbols': len(std_multiples),
+        'repeat': repeat,
+        'reference_seconds': round(reference_seconds, 4),
+        'engine_seconds': round(engine_seconds, 4),
+        'symbols_per_second': round(len(std_multiples) / engine_seconds, 1) if engine_seconds > 0 else None,
+        'speedup': round(reference_seconds / engine_seconds, 2) if engine_seconds > 0 else None,
+    }
+
+
+def append_history(path, record):
+    """将基准测试结果追加到JSON数组文件，便于跟踪耗时变化"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    except FileNotFoundError:
+        history = []
+    history.append(record)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='估值计算黄金数据回归与基准测试')
+    parser.add_argument('--fixture', default=GOLDEN_FIXTURE_DB, help='快照数据库路径')
+    parser.add_argument('--golden', default=GOLDEN_RESULTS_FILE, help='黄金结果文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    freeze_parser = subparsers.add_parser('freeze', help='从数据库冻结快照并生成黄金结果')
+    freeze_parser.add_argument('--db', default=DB_PATH, help='源数据库路径')
+    freeze_parser.add_argument('--symbol', action='append', help='只冻结指定股票，可重复指定')
+
+    subparsers.add_parser('record', help='使用参考实现重新生成黄金结果（估值规则有意变更时使用）')
+    subparsers.add_parser('synth', help='生成仓库中提交的模拟快照及其黄金结果')
+
+    check_parser = subparsers.add_parser('check', help='校验估值引擎与黄金结果一致')
+    check_parser.add_argument('--engine', help='估值引擎工厂函数，格式为 模块:函数，默认为当前StockDataProcessor')
+    check_parser.add_argument('--abs-tol', type=float, default=DEFAULT_ABS_TOL, help='绝对容差')
+    check_parser.add_argument('--rel-tol', type=float, default=DEFAULT_REL_TOL, help='相对容差')
+
+    bench_parser = subparsers.add_parser('bench', help='对比参考实现与估值引擎的耗时')
+    bench_parser.add_argument('--engine', help='估值引擎工厂函数，格式为 模块:函数，默认为当前StockDataProcessor')
+    bench_parser.add_argument('--repeat', type=int, default=5, help='测试次数，取中位数')
+    bench_parser.add_argument('--json', dest='json_file', help='将结果追加到JSON文件，便于跟踪变化')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.command in ('check', 'bench') else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'freeze':
+        freeze_fixture(args.db, args.fixture, args.symbol)
+        record_golden(args.fixture, args.golden)
+        return 0
+
+    if args.command == 'synth':
+        build_synthetic_fixture(SYNTHETIC_FIXTURE_DB)
+        record_golden(SYNTHETIC_FIXTURE_DB, SYNTHETIC_GOLDEN_FILE)
+        return 0
+
+    if args.command == 'record':
+        record_golden(args.fixture, args.golden)
+        return 0
+
+    engine_factory = load_engine(args.engine)
+    if args.command == 'check':
+        mismatches = check_engine(engine_factory, args.fixture, args.golden, args.abs_tol, args.rel_tol)
+        if not mismatches:
+            print("✅ 估值结果与黄金结果一致")
+            return 0
+        for symbol, differences in mismatches.items():
+            for field, expected, actual in differences:
+                print(f"❌ {symbol} {field}: 期望 {expected}，实际 {actual}")
+        print(f"共 {len(mismatches)} 个股票的估值结果与黄金结果不一致")
+        return 1
+
+    result = benchmark(engine_factory, args.fixture, args.repeat)
+    print(f"股票数: {result['symbols']}  参考实现: {result['reference_seconds']}s  "
+          f"估值引擎: {result['engine_seconds']}s  股票/秒: {result['symbols_per_second']}  "
+          f"加速比: {result['speedup']}")
+    if args.json_file:
+        append_history(args.json_file, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
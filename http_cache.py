@@ -0,0 +1,136 @@
+# HTTP响应缓存模块
+import os
+import json
+import time
+import hashlib
+import logging
+from urllib.parse import urlencode
+from config import HTTP_CACHE_DIR, HTTP_CACHE_TTL, HTTP_CACHE_MODE
+
+
+class CachedResponse:
+    """缓存命中或网络请求后的响应结果"""
+
+    def __init__(self, text, changed, result=None, from_cache=False):
+        self.text = text
+        # 内容哈希是否发生变化，未变化时可直接复用之前的解析结果
+        self.changed = changed
+        self.result = result
+        self.from_cache = from_cache
+
+
+class HttpCache:
+    """基于磁盘的HTTP缓存，按URL存储响应体及ETag/Last-Modified
+
+    mode:
+        online  - 缓存过期后发送条件请求，内容未变化时复用解析结果
+        offline - 仅从缓存回放，不发起任何网络请求（用于测试）
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, ttl=HTTP_CACHE_TTL, mode=HTTP_CACHE_MODE):
+        if mode not in ('online', 'offline'):
+            raise ValueError(f"不支持的缓存模式: {mode}")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.mode = mode
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _key(self, url, params=None):
+        """根据URL和查询参数生成缓存键"""
+        full_url = url
+        if params:
+            full_url = f"{url}?{urlencode(sorted(params.items()))}"
+        return hashlib.sha256(full_url.encode('utf-8')).hexdigest(), full_url
+
+    def _paths(self, key):
+        return (os.path.join(self.cache_dir, f"{key}.json"),
+                os.path.join(self.cache_dir, f"{key}.body"))
+
+    def _load(self, key):
+        """读取缓存条目，不存在或损坏时返回(None, None)"""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'r', encoding='utf-8') as f:
+                body = f.read()
+            return meta, body
+        except (OSError, ValueError):
+            return None, None
+
+    def _save(self, key, meta, body=None):
+        """写入缓存条目，body为None时只更新元数据"""
+        meta_path, body_path = self._paths(key)
+        if body is not None:
+            with open(body_path, 'w', encoding='utf-8') as f:
+                f.write(body)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def fetch(self, session, url, params=None, headers=None, encoding=None, timeout=30):
+        """获取URL内容，优先使用缓存
+
+        返回CachedResponse；离线模式下缓存缺失时返回None
+        """
+        key, full_url = self._key(url, params)
+        meta, body = self._load(key)
+
+        if self.mode == 'offline':
+            if meta is None:
+                logging.warning(f"离线模式下缓存缺失: {full_url}")
+                return None
+            return CachedResponse(body, False, meta.get('result'), from_cache=True)
+
+        now = time.time()
+        # 未过期直接返回缓存，不发起请求
+        if meta is not None and now - meta.get('fetched_at', 0) < self.ttl:
+            return CachedResponse(body, False, meta.get('result'), from_cache=True)
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        response = session.get(url, params=params, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            meta['fetched_at'] = now
+            self._save(key, meta)
+            logging.info(f"缓存未变化(304): {full_url}")
+            return CachedResponse(body, False, meta.get('result'), from_cache=True)
+
+        response.raise_for_status()
+        if encoding:
+            response.encoding = encoding
+        text = response.text
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        if meta is not None and meta.get('content_hash') == content_hash:
+            # 服务端不支持条件请求，但内容哈希未变化
+            meta['fetched_at'] = now
+            meta['etag'] = response.headers.get('ETag') or meta.get('etag')
+            meta['last_modified'] = response.headers.get('Last-Modified') or meta.get('last_modified')
+            self._save(key, meta)
+            return CachedResponse(body, False, meta.get('result'))
+
+        meta = {
+            'url': full_url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash,
+            'fetched_at': now,
+            'result': None
+        }
+        self._save(key, meta, text)
+        return CachedResponse(text, True)
+
+    def save_result(self, url, params, result):
+        """保存响应内容对应的解析结果，内容未变化时可跳过解析"""
+        key, _ = self._key(url, params)
+        meta, _ = self._load(key)
+        if meta is None:
+            return
+        meta['result'] = result
+        self._save(key, meta)
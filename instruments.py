@@ -0,0 +1,214 @@
+# 证券代码注册表模块
+import os
+import csv
+import sqlite3
+import logging
+from functools import lru_cache
+from typing import NamedTuple
+from config import DB_PATH, STOCKS_DATA_FILE, POSITION_DATA_FILE
+from database import SQLITE_BUSY_TIMEOUT
+
+# 现金持仓在position.csv中的代码
+CASH_CODE = '000000'
+CASH_SYMBOL = 'CASH'
+
+# A股6位代码按首位判断交易所（92开头为北交所新代码，需先于9判断）
+A_SHARE_PREFIXES = [('92', 'BJ'), ('4', 'BJ'), ('8', 'BJ'), ('5', 'SH'), ('6', 'SH'), ('9', 'SH'),
+                    ('0', 'SZ'), ('1', 'SZ'), ('2', 'SZ'), ('3', 'SZ')]
+# 市场所属地区，决定交易时段和币种
+MARKET_REGIONS = {'SH': 'cn', 'SZ': 'cn', 'BJ': 'cn', 'HK': 'hk', 'US': 'us', 'CASH': 'cash'}
+
+# 证券代码维度表，注册表和紧凑存储（compact_storage.stock_daily）共用同一个symbol_id
+SYMBOL_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS stock_symbol (
+        symbol_id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE
+    )
+'''
+
+
+def create_symbol_table(conn):
+    """创建证券代码维度表"""
+    conn.execute(SYMBOL_TABLE_SQL)
+
+
+class Instrument(NamedTuple):
+    """证券，symbol为规范代码（与雪球、stocks_data.csv一致，如 SH600519、HK00700、BJ830799、AAPL），
+    id为stock_symbol表中的symbol_id
+    """
+    id: int
+    symbol: str
+    market: str  # SH, SZ, BJ, HK, US, CASH
+    code: str  # 不带市场前缀的代码
+    name: str = ''
+
+    @property
+    def region(self):
+        return MARKET_REGIONS[self.market]
+
+    @property
+    def xueqiu_code(self):
+        """雪球K线接口代码：港股不带前缀"""
+        return self.code if self.market == 'HK' else self.symbol
+
+    @property
+    def ths_code(self):
+        """同花顺业绩预测页面代码（仅A股）"""
+        return self.code if self.region == 'cn' else None
+
+    @property
+    def etnet_code(self):
+        """etnet业绩预测页面代码（仅港股）"""
+        return self.code if self.market == 'HK' else None
+
+    @property
+    def tencent_code(self):
+        """腾讯行情接口代码，如 sh600519、hk00700、usAAPL"""
+        if self.market == 'CASH':
+            return None
+        return f"{self.market.lower()}{self.code}"
+
+
+@lru_cache(maxsize=4096)
+def parse_symbol(text):
+    """解析各种写法的证券代码，返回(市场, 代码)
+
+    支持 SH600519 / sh600519 / 600519 / 600519.SH、HK00700 / hk00700 / 00700 / 700.HK、
+    BJ830799 / 830799 / 920001、AAPL / usAAPL / AAPL.US，以及现金代码 000000
+    """
+    raw = str(text).strip()
+    value = raw.upper()
+    if value in (CASH_CODE, CASH_SYMBOL):
+        return 'CASH', CASH_SYMBOL
+
+    # 600519.SH / 00700.HK / AAPL.US
+    if '.' in value and value.rsplit('.', 1)[1] in MARKET_REGIONS:
+        code, market = value.rsplit('.', 1)
+        value = market + code
+
+    market, code = value[:2], value[2:]
+    if market in ('SH', 'SZ', 'BJ') and code.isdigit() and len(code) == 6:
+        return market, code
+    if market == 'HK' and code.isdigit() and 0 < len(code) <= 5:
+        return 'HK', code.zfill(5)
+    # 美股只接受腾讯写法的小写us前缀，避免与USB等代码混淆
+    if (raw.startswith('us') or market == 'US' and '.' in raw) and code:
+        return 'US', code
+    if value.isdigit():
+        if len(value) == 6:
+            for prefix, exchange in A_SHARE_PREFIXES:
+                if value.startswith(prefix):
+                    return exchange, value
+        elif len(value) <= 5:
+            return 'HK', value.zfill(5)
+    if value.replace('.', '').isalpha():
+        return 'US', value
+    raise ValueError(f"无法识别的证券代码: {text}")
+
+
+def normalize_symbol(text):
+    """转换为规范代码，如 600519 -> SH600519, hk00700 -> HK00700, usAAPL -> AAPL"""
+    market, code = parse_symbol(text)
+    return code if market in ('US', 'CASH') else f"{market}{code}"
+
+
+class InstrumentRegistry:
+    """证券注册表：规范代码对应stock_symbol表中的整数id（跨运行稳定），
+    各种写法的代码通过别名字典O(1)查找
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._by_id = {}
+        self._by_symbol = {}
+        self._aliases = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def _symbol_ids(self, symbols):
+        """查找规范代码在stock_symbol表中的id，不存在的代码写入新id"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            create_symbol_table(conn)
+            ids = {}
+            for symbol in symbols:
+                row = conn.execute('SELECT symbol_id FROM stock_symbol WHERE symbol = ?', (symbol,)).fetchone()
+                if row is None:
+                    row = (conn.execute('INSERT INTO stock_symbol (symbol) VALUES (?)', (symbol,)).lastrowid,)
+                ids[symbol] = row[0]
+            conn.commit()
+            return ids
+        finally:
+            conn.close()
+
+    def register(self, text, name='', symbol_id=None):
+        """注册证券，已注册时补充名称，返回Instrument"""
+        symbol = normalize_symbol(text)
+        instrument = self._by_symbol.get(symbol)
+        if instrument is None:
+            market, code = parse_symbol(text)
+            if symbol_id is None:
+                symbol_id = self._symbol_ids([symbol])[symbol]
+            instrument = Instrument(symbol_id, symbol, market, code, name or '')
+        elif name and not instrument.name:
+            instrument = instrument._replace(name=name)
+            # 已缓存的别名指向旧对象，一并更新
+            for alias, cached in self._aliases.items():
+                if cached.id == instrument.id:
+                    self._aliases[alias] = instrument
+        self._by_id[instrument.id] = instrument
+        self._by_symbol[symbol] = instrument
+        self._aliases[text] = instrument
+        self._aliases[symbol] = instrument
+        return instrument
+
+    def resolve(self, text):
+        """按任意写法查找证券，未注册的代码自动注册"""
+        instrument = self._aliases.get(text)
+        if instrument is None:
+            instrument = self.register(text)
+        return instrument
+
+    def by_id(self, instrument_id):
+        return self._by_id[instrument_id]
+
+    def load_csv(self, path, code_column='股票代码', name_column='股票名称'):
+        """从CSV文件注册证券，新代码的id在一个数据库连接中分配"""
+        entries = []
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    text = row[code_column].strip()
+                    try:
+                        entries.append((text, normalize_symbol(text), row.get(name_column, '')))
+                    except ValueError as e:
+                        logging.warning(f"{path}: {e}，已跳过")
+        except FileNotFoundError:
+            logging.warning(f"证券列表文件不存在: {path}")
+
+        new_symbols = list(dict.fromkeys(symbol for _, symbol, _ in entries if symbol not in self._by_symbol))
+        symbol_ids = self._symbol_ids(new_symbols) if new_symbols else {}
+        for text, symbol, name in entries:
+            self.register(text, name, symbol_ids.get(symbol))
+        return self
+
+
+_registry = None
+
+
+def get_registry():
+    """默认注册表：依次注册stocks_data.csv和position.csv中的证券"""
+    global _registry
+    if _registry is None:
+        _registry = InstrumentRegistry().load_csv(STOCKS_DATA_FILE).load_csv(POSITION_DATA_FILE)
+    return _registry
+
+
+def resolve(text):
+    """在默认注册表中查找证券"""
+    return get_registry().resolve(text)
@@ -0,0 +1,231 @@
+# 盘中实时估值模块
+import csv
+import time
+import sqlite3
+import logging
+import argparse
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+import requests
+from config import (DB_PATH, STOCKS_DATA_FILE, OUTPUT_JSON_DIR, FUTURE_PE_FACTOR,
+                    LIVE_POLL_INTERVAL, LIVE_QUOTE_BATCH_SIZE, LIVE_EVENT_LIMIT, LIVE_TRADING_SESSIONS,
+                    beijing_tz)
+from data_position import fetch_stock_quotes
+from artifacts import atomic_write_json
+from instruments import resolve
+
+LIVE_SNAPSHOT_FILE = f"{OUTPUT_JSON_DIR}/live_valuation.json"
+# 估值分组，与首页行颜色规则（valuation_rules.valuation_bucket）一致
+BUCKETS = ['hold', 'sell', 'single_buy', 'double_buy']
+# 交易时段外最长休眠秒数
+MAX_IDLE_SLEEP = 600
+
+
+def load_symbols(path=STOCKS_DATA_FILE):
+    """读取股票代码和名称（不依赖pandas，保持常驻进程内存占用小）"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['股票代码'], row['股票名称']) for row in csv.DictReader(f)]
+
+
+def load_daily_stats(symbols, db_path=DB_PATH):
+    """读取每个股票最新一条估值记录，盘中只依赖这些日度统计量，不再查询数据库"""
+    placeholders = ', '.join('?' * len(symbols))
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(f'''
+            SELECT v.symbol, v.current_close, v.current_pe, v.reasonable_pe, v.pe_percentile_90,
+                   v.pe_buy_point, v.profit_buy_point, v.predicted_net_profit, b.market_capital
+            FROM stock_valuation v
+            JOIN (SELECT symbol, MAX(timestamp) AS timestamp FROM stock_valuation
+                  WHERE symbol IN ({placeholders}) GROUP BY symbol) latest
+            ON v.symbol = latest.symbol AND v.timestamp = latest.timestamp
+            LEFT JOIN stock_basic_data b ON b.symbol = v.symbol AND b.timestamp = v.timestamp
+        ''', symbols).fetchall()
+    finally:
+        conn.close()
+    return {row[0]: row[1:] for row in rows}
+
+
+class LiveValuationModel:
+    """按股票向量化保存日度统计量，每次行情更新只做O(股票数)的数组运算
+
+    市盈率买点 = 每股收益 * 合理市盈率 * 折扣，利润买点 = 合理市盈率 * 0.8 * 预测利润 / 总股本 * 折扣，
+    两者与当前价无关，盘中只需用最新价重新计算市盈率和估值比例
+    """
+
+    def __init__(self, symbols, names, stats):
+        self.symbols = [s for s in symbols if s in stats]
+        self.names = [names[s] for s in self.symbols]
+        instruments = [resolve(s) for s in self.symbols]
+        self.quote_codes = np.array([instrument.tencent_code for instrument in instruments])
+        self.markets = np.array([instrument.region for instrument in instruments])
+
+        values = np.array([stats[s] for s in self.symbols], dtype=float).reshape(len(self.symbols), 8)
+        close, pe, reasonable_pe, pe_p90, pe_buy, profit_buy, profit, market_capital = values.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.eps = np.where(pe > 0, close / pe, np.nan)
+            # 净利润估值 = 当前价 * 总股本 / (合理市盈率 * 0.8 * 预测利润)
+            shares = market_capital / close
+            self.profit_valuation_per_price = np.where(
+                (reasonable_pe > 0) & (profit > 0), shares / (reasonable_pe * FUTURE_PE_FACTOR * profit), np.nan
+            )
+        self.reasonable_pe = reasonable_pe
+        self.pe_p90 = np.nan_to_num(pe_p90)
+        self.pe_buy = np.nan_to_num(pe_buy)
+        self.profit_buy = np.nan_to_num(profit_buy)
+
+        n = len(self.symbols)
+        self.prices = np.full(n, np.nan)
+        self.changes = np.zeros(n)
+        self.buckets = np.full(n, -1, dtype=np.int8)
+
+    def update(self, quotes):
+        """用最新行情更新价格并重新分组，返回分组发生变化（跨越阈值）的股票下标"""
+        for i, code in enumerate(self.quote_codes):
+            quote = quotes.get(code)
+            if quote:
+                self.prices[i], self.changes[i] = quote
+
+        prices = self.prices
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.pe = prices / self.eps
+            self.pe_valuation = self.pe / self.reasonable_pe
+            self.net_profit_valuation = prices * self.profit_valuation_per_price
+        below_pe_buy = prices <= self.pe_buy
+        below_profit_buy = prices <= self.profit_buy
+        sell = self.pe_p90 <= np.nan_to_num(self.pe)
+        buckets = np.where(below_pe_buy & below_profit_buy, 3,
+                           np.where(below_pe_buy | below_profit_buy, 2, np.where(sell, 1, 0))).astype(np.int8)
+        buckets[np.isnan(prices)] = -1
+
+        changed = np.flatnonzero(buckets != self.buckets)
+        previous = self.buckets
+        self.buckets = buckets
+        return changed, previous
+
+    def rows(self):
+        """当前所有股票的实时估值"""
+        def value(array, i):
+            return None if np.isnan(array[i]) else round(float(array[i]), 2)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pe_buy_distance = self.prices / np.where(self.pe_buy > 0, self.pe_buy, np.nan) - 1
+            profit_buy_distance = self.prices / np.where(self.profit_buy > 0, self.profit_buy, np.nan) - 1
+        return [{
+            'symbol': symbol,
+            'name': self.names[i],
+            'price': value(self.prices, i),
+            'change': round(float(self.changes[i]), 2),
+            'pe': value(self.pe, i),
+            'pe_valuation': value(self.pe_valuation, i),
+            'net_profit_valuation': value(self.net_profit_valuation, i),
+            'pe_buy_point': round(float(self.pe_buy[i]), 2),
+            'profit_buy_point': round(float(self.profit_buy[i]), 2),
+            'pe_buy_distance': value(pe_buy_distance, i),
+            'profit_buy_distance': value(profit_buy_distance, i),
+            'bucket': BUCKETS[self.buckets[i]] if self.buckets[i] >= 0 else None,
+        } for i, symbol in enumerate(self.symbols)]
+
+
+def open_markets(now):
+    """当前处于交易时段的市场（不含节假日判断，休市日行情不变不会触发阈值变化）"""
+    if now.weekday() >= 5:
+        return set()
+    clock = now.strftime('%H:%M')
+    return {market for market, sessions in LIVE_TRADING_SESSIONS.items()
+            if any(start <= clock < end for start, end in sessions)}
+
+
+def seconds_until_open(now):
+    """距离下一个交易时段开始的秒数"""
+    for days in range(8):
+        day = now + timedelta(days=days)
+        if day.weekday() >= 5:
+            continue
+        for sessions in LIVE_TRADING_SESSIONS.values():
+            for start, _ in sessions:
+                hour, minute = map(int, start.split(':'))
+                begin = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if begin > now:
+                    return (begin - now).total_seconds()
+    return MAX_IDLE_SLEEP
+
+
+def write_snapshot(model, events, now):
+    snapshot = {
+        'update_time': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'stocks': model.rows(),
+        'events': list(events),
+    }
+    atomic_write_json(LIVE_SNAPSHOT_FILE, snapshot, separators=(',', ':'))
+
+
+def run_live(interval=LIVE_POLL_INTERVAL, max_ticks=None, ignore_hours=False):
+    """盘中轮询批量行情，只在股票跨越买点/卖点阈值时写入快照文件
+
+    只读取数据库、只写 live_valuation.json，不持有运行锁，可与每日任务同时运行
+    """
+    symbols = load_symbols()
+    names = dict(symbols)
+    session = requests.Session()
+    events = deque(maxlen=LIVE_EVENT_LIMIT)
+    model = None
+    stats_day = None
+    ticks = 0
+
+    while max_ticks is None or ticks < max_ticks:
+        now = datetime.now(beijing_tz)
+        # 每个交易日加载一次日度统计量（收盘后的process任务会更新估值表）
+        if now.date() != stats_day:
+            stats = load_daily_stats([s for s, _ in symbols])
+            model = LiveValuationModel([s for s, _ in symbols], names, stats)
+            stats_day = now.date()
+            logging.info(f"已加载 {len(model.symbols)} 个股票的日度估值统计")
+
+        markets = set(LIVE_TRADING_SESSIONS) if ignore_hours else open_markets(now)
+        if not markets:
+            sleep_seconds = min(seconds_until_open(now), MAX_IDLE_SLEEP)
+            logging.info(f"非交易时段，{sleep_seconds:.0f} 秒后重试")
+            time.sleep(sleep_seconds)
+            continue
+
+        started = time.monotonic()
+        codes = model.quote_codes[np.isin(model.markets, list(markets))].tolist()
+        quotes = {}
+        for i in range(0, len(codes), LIVE_QUOTE_BATCH_SIZE):
+            quotes.update(fetch_stock_quotes(codes[i:i + LIVE_QUOTE_BATCH_SIZE], session=session))
+
+        first_tick = not np.any(model.buckets >= 0)
+        changed, previous = model.update(quotes)
+        for i in changed:
+            if previous[i] < 0:
+                continue
+            events.append({
+                'time': now.strftime('%Y-%m-%d %H:%M:%S'),
+                'symbol': model.symbols[i],
+                'name': model.names[i],
+                'price': round(float(model.prices[i]), 2),
+                'from': BUCKETS[previous[i]],
+                'to': BUCKETS[model.buckets[i]] if model.buckets[i] >= 0 else None,
+            })
+            logging.info(f"{model.symbols[i]} {model.names[i]} 估值分组变化: "
+                         f"{BUCKETS[previous[i]]} -> {events[-1]['to']}，当前价 {events[-1]['price']}")
+        if first_tick or len(changed):
+            write_snapshot(model, events, now)
+
+        ticks += 1
+        elapsed = time.monotonic() - started
+        logging.debug(f"获取 {len(quotes)}/{len(codes)} 个行情，耗时 {elapsed:.2f} 秒")
+        if max_ticks is None or ticks < max_ticks:
+            time.sleep(max(0.0, interval - elapsed))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='盘中实时估值')
+    parser.add_argument('--interval', type=float, default=LIVE_POLL_INTERVAL, help='行情轮询间隔(秒)')
+    parser.add_argument('--ticks', type=int, help='轮询次数，默认一直运行')
+    parser.add_argument('--ignore-hours', action='store_true', help='忽略交易时段（配合模拟服务器测试）')
+    args = parser.parse_args()
+    run_live(args.interval, max_ticks=args.ticks, ignore_hours=args.ignore_hours)
@@ -1,10 +1,25 @@
 # 主程序入口
 import logging
 import argparse
-from data_fetcher import StockDataFetcher
-from data_processor import StockDataProcessor
-from data_position import process_positions
-from database import StockDatabase
+import importlib
+from config import OUTPUT_JSON_DIR, LIVE_POLL_INTERVAL
+from artifacts import run_lock, cleanup_stale_staging
+
+# 各运行模式需要导入的模块，按需导入以减少启动耗时（position模式无需pandas）
+MODE_MODULES = {
+    'basic_data': ['database', 'data_fetcher'],
+    'profit_data': ['database', 'data_fetcher'],
+    'process': ['database', 'data_processor'],
+    'position': ['data_position', 'portfolio_analytics', 'report'],
+    'retention': ['retention'],
+    'all': ['database', 'data_fetcher', 'retention', 'data_processor', 'data_position', 'portfolio_analytics',
+            'report'],
+    'live': ['live'],
+}
+
+def load_mode_modules(mode):
+    """导入指定模式所需的模块"""
+    return [importlib.import_module(name) for name in MODE_MODULES[mode]]
 
 def setup_logging():
     """配置日志"""
@@ -21,26 +36,47 @@ def main():
     setup_logging()
     
     parser = argparse.ArgumentParser(description='股票数据分析与估值系统')
-    parser.add_argument('--mode', choices=['basic_data','profit_data', 'process', 'position', 'all'], default='all',
+    parser.add_argument('--mode', choices=list(MODE_MODULES), default='all',
                        help='运行模式: basic_data-仅获取基础数据, \
                        profit_data-仅获取业绩预测数据, \
                        process-仅处理数据, \
                        position-仅处理持仓数据, \
-                       all-全部执行')
+                       retention-历史数据降采样和数据库整理, \
+                       all-全部执行, \
+                       live-盘中实时估值（常驻运行）')
     parser.add_argument('--delay', type=float, default=1.0,
                        help='API请求间隔时间(秒)')
+    parser.add_argument('--interval', type=float, default=LIVE_POLL_INTERVAL,
+                       help='live模式的行情轮询间隔(秒)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='process模式并行计算的进程数')
     
     args = parser.parse_args()
     
     logging.info("开始运行股票数据分析与估值系统")
     
+    if args.mode == 'live':
+        # 实时估值只读数据库、只写自己的快照文件，不占用运行锁，避免阻塞每日任务
+        from live import run_live
+        run_live(interval=args.interval)
+        return
+    
+    with run_lock():
+        cleanup_stale_staging(OUTPUT_JSON_DIR)
+        run_modes(args)
+
+def run_modes(args):
+    """按运行模式执行各阶段任务"""
     try:
-        # 初始化数据库
-        db = StockDatabase()
-        logging.info("数据库初始化完成")
+        if 'database' in MODE_MODULES[args.mode]:
+            # 初始化数据库
+            from database import StockDatabase
+            db = StockDatabase()
+            logging.info("数据库初始化完成")
         
         if args.mode in ['basic_data', 'all']:
             # 获取数据
+            from data_fetcher import StockDataFetcher
             logging.info("开始获取股票数据")
             fetcher = StockDataFetcher()
             fetcher.fetch_all_stocks_data(delay=args.delay)
@@ -48,23 +84,38 @@ def main():
 
         if args.mode in ['profit_data', 'all']:
             # 获取业绩预测数据
+            from data_fetcher import StockDataFetcher
             logging.info("开始获取股票业绩预测数据")
             fetcher = StockDataFetcher()
             fetcher.fetch_all_profit_forecasts(delay=args.delay)
             logging.info("股票业绩预测数据获取完成")
             
+        if args.mode in ['retention', 'all']:
+            # 估值历史和市值趋势按保留策略降采样，在导出前执行以缩小导出文件
+            from retention import run_retention
+            logging.info("开始执行历史数据保留策略")
+            run_retention()
+            logging.info("历史数据保留策略执行完成")
+
         if args.mode in ['process', 'all']:
             # 处理数据
+            from data_processor import StockDataProcessor
             logging.info("开始处理股票数据")
             processor = StockDataProcessor()
-            results = processor.process_all_stocks()
+            results = processor.process_all_stocks(workers=args.workers)
             processor.save_to_json()
             logging.info(f"股票数据处理完成，共处理 {len(results)} 个股票")
 
         if args.mode in ['position', 'all']:
             # 处理数据
+            from data_position import process_positions
+            from portfolio_analytics import save_portfolio_analytics
+            from report import generate_reports
             logging.info("开始处理持仓数据")
-            process_positions()
+            position_result = process_positions()
+            analytics = save_portfolio_analytics(position_result)
+            # 直接使用内存中的持仓和分析结果生成README等报告
+            generate_reports(position_result, analytics)
             logging.info("持仓数据处理完成")
 
         logging.info("股票数据分析与估值系统运行完成")
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地行情模拟服务器
+模拟雪球K线、同花顺/etnet业绩预测、腾讯行情和汇率接口，用于离线压测和CI
+录制模式下将请求转发到真实数据源，并按路径和查询参数保存所有接口的响应；
+回放时优先返回录制目录和HTTP缓存目录中的响应，没有录制的请求返回合成数据
+
+用法:
+    python mock_server.py --port 8765 --latency 50 --error-rate 0.05 --rate-limit 20
+    MARKET_DATA_BASE_URL=http://127.0.0.1:8765 python main.py --mode basic_data --delay 0
+
+    # 录制真实响应，之后不带--record启动即可回放
+    python mock_server.py --port 8765 --record
+    MARKET_DATA_BASE_URL=http://127.0.0.1:8765 python main.py --mode all
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+import requests
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import HTTP_CACHE_DIR, MOCK_RECORDING_DIR, UPSTREAM_BASE_URLS
+
+DAY_MS = 86400 * 1000
+BEIJING_OFFSET_MS = 8 * 3600 * 1000
+KLINE_COLUMNS = ['timestamp', 'volume', 'open', 'high', 'low', 'close', 'chg', 'percent', 'turnoverrate',
+                 'amount', 'volume_post', 'amount_post', 'pe', 'market_capital']
+# 各接口路径前缀对应的数据源（config.UPSTREAM_BASE_URLS的键），录制模式按此转发请求
+ROUTE_UPSTREAMS = [
+    ('/v5/stock/chart/', 'XUEQIU_BASE_URL'),
+    ('/new/', 'THS_BASE_URL'),
+    ('/www/sc/stocks/', 'ETNET_BASE_URL'),
+    ('/q=', 'TENCENT_QUOTE_BASE_URL'),
+    ('/v4/latest/', 'EXCHANGE_RATE_BASE_URL'),
+]
+# 每次运行都会变化的查询参数（雪球K线的begin为次日零点），不参与回放匹配
+VOLATILE_PARAMS = {'begin'}
+# 转发时不传给数据源的请求头，响应体由requests解压后原样保存
+HOP_HEADERS = {'host', 'connection', 'accept-encoding', 'if-none-match', 'if-modified-since'}
+
+
+def _rng(*keys):
+    """按股票代码等生成确定性的随机数发生器，同一个代码每次返回相同的数据"""
+    seed = int(hashlib.md5('|'.join(map(str, keys)).encode('utf-8')).hexdigest()[:8], 16)
+    return random.Random(seed)
+
+
+def synth_kline(symbol, begin_ms, count):
+    """生成雪球K线接口格式的数据，count为负数时返回begin之前的|count|个交易日"""
+    rng = _rng(symbol)
+    base_price = rng.uniform(10, 500)
+    base_eps = base_price / rng.uniform(10, 40)
+    shares = rng.uniform(1e8, 1e10)
+    volatility = rng.uniform(0.01, 0.03)
+
+    # 以北京时间零点为K线时间戳，跳过周末
+    day = (begin_ms + BEIJING_OFFSET_MS) // DAY_MS - 1
+    days = []
+    while len(days) < abs(count):
+        if (day + 3) % 7 < 5:  # 1970-01-01为周四
+            days.append(day)
+        day -= 1
+    days.reverse()
+
+    items = []
+    for day in days:
+        day_rng = _rng(symbol, day)
+        # 以日序号为参数的确定性价格曲线，同一天多次请求结果一致
+        close = round(base_price * (1 + 0.3 * math.sin(day / 180.0)) * (1 + day_rng.gauss(0, volatility)), 2)
+        pe = round(close / base_eps, 4)
+        items.append([day * DAY_MS - BEIJING_OFFSET_MS, day_rng.randint(10000, 1000000), close, close, close, close,
+                      0.0, 0.0, 0.5, close * 10000, None, None, pe, round(close * shares, 2)])
+    return {'data': {'symbol': symbol, 'column': KLINE_COLUMNS, 'item': items}, 'error_code': 0, 'error_description': ''}
+
+
+def synth_ths_worth(code):
+    """生成同花顺业绩预测页面，第二个表格包含年度、最小值、均值（亿元）"""
+    rng = _rng('ths', code)
+    profit = rng.uniform(5, 800)
+    rows = ''.join(
+        f"<tr><td>{2025 + i}</td><td>{rng.randint(3, 30)}</td><td>{profit * (1 + 0.1 * i) * 0.9:.2f}</td>"
+        f"<td>{profit * (1 + 0.1 * i):.2f}</td><td>{profit * (1 + 0.1 * i) * 1.1:.2f}</td></tr>"
+        for i in range(3)
+    )
+    return (
+        "<html><head><meta charset='gbk'></head><body>"
+        "<table><tr><th>机构</th></tr><tr><td>-</td></tr></table>"
+        "<table><thead><tr><th>年度</th><th>预测机构数</th><th>最小值</th><th>均值</th><th>最大值</th></tr></thead>"
+        f"<tbody>{rows}</tbody></table></body></html>"
+    )
+
+
+def synth_etnet_profit(code):
+    """生成etnet业绩预测页面，第四个表格包含财政年度和纯利预测（百万元人民币）"""
+    rng = _rng('etnet', code)
+    profit = rng.uniform(1000, 200000)
+    filler = "<table><tr><th>-</th></tr><tr><td>-</td></tr></table>"
+    rows = ''.join(f"<tr><td>{2025 + i}</td><td>{profit * (1 + 0.1 * i):.2f}</td></tr>" for i in range(3))
+    return (
+        f"<html><body>{filler * 3}"
+        "<table><tr><td>财政年度</td><td>纯利/(亏损)<br> (百万元人民币)</td></tr>"
+        f"{rows}</table></body></html>"
+    )
+
+
+def synth_tencent_quotes(codes):
+    """生成腾讯行情接口格式的数据，支持逗号分隔的批量代码"""
+    lines = []
+    for code in codes:
+        rng = _rng('quote', code, int(time.time() // 3))
+        price = round(_rng(code).uniform(10, 500) * (1 + rng.gauss(0, 0.01)), 2)
+        parts = ['1', f'模拟{code}', code[2:], f'{price:.2f}'] + ['0'] * 46
+        parts[32] = f'{rng.gauss(0, 1.5):.2f}'
+        lines.append(f'v_{code}="{"~".join(parts)}";')
+    return '\n'.join(lines) + '\n'
+
+
+def upstream_url(path):
+    """请求路径对应的真实数据源地址，未知路径返回None"""
+    for prefix, name in ROUTE_UPSTREAMS:
+        if path.startswith(prefix):
+            return (os.environ.get(name) or UPSTREAM_BASE_URLS[name]).rstrip('/') + path
+    return None
+
+
+def _replay_key(url):
+    """回放匹配键：路径和排序后的查询参数"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, values in parse_qs(parts.query).items() for v in values
+                   if k not in VOLATILE_PARAMS)
+    return parts.path, tuple(query)
+
+
+class ResponseRecorder:
+    """录制模式下保存数据源的响应：{哈希}.json 为路径和Content-Type，{哈希}.body 为原始响应体"""
+
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+        os.makedirs(record_dir, exist_ok=True)
+
+    def save(self, url, content_type, body):
+        key = hashlib.sha256(repr(_replay_key(url)).encode('utf-8')).hexdigest()
+        with open(os.path.join(self.record_dir, f"{key}.body"), 'wb') as f:
+            f.write(body)
+        with open(os.path.join(self.record_dir, f"{key}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'content_type': content_type}, f, ensure_ascii=False)
+
+
+class ReplayStore:
+    """从录制目录和HTTP缓存目录回放响应，按路径和查询参数匹配，后加载的目录优先
+
+    录制目录（ResponseRecorder）覆盖所有接口，保存原始响应体和Content-Type；
+    HTTP缓存目录（HttpCache）只有同花顺/etnet业绩预测页面，响应体为解码后的文本
+    """
+
+    def __init__(self, *dirs):
+        # 匹配键 -> (响应体bytes, Content-Type)
+        self.responses = {}
+        for directory in dirs:
+            if directory and os.path.isdir(directory):
+                self._load_dir(directory)
+        logging.info(f"加载 {len(self.responses)} 条录制的响应")
+
+    def _load_dir(self, directory):
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                with open(os.path.join(directory, name[:-5] + '.body'), 'rb') as f:
+                    body = f.read()
+            except (OSError, ValueError):
+                continue
+            content_type = meta.get('content_type')
+            if content_type is None:
+                # HttpCache保存的是UTF-8文本，同花顺页面按原编码返回
+                encoding = 'gbk' if '/worth.html' in meta['url'] else 'utf-8'
+                body = body.decode('utf-8').encode(encoding)
+                content_type = f'text/html; charset={encoding}'
+            self.responses[_replay_key(meta['url'])] = (body, content_type)
+
+    def get(self, url):
+        return self.responses.get(_replay_key(url))
+
+
+class TokenBucket:
+    """令牌桶限流"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockMarketHandler(BaseHTTPRequestHandler):
+    server_version = 'MockMarket/1.0'
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send(self, status, body, content_type='text/plain; charset=utf-8', encoding='utf-8'):
+        data = body.encode(encoding) if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+
+        if self.path == '/__stats':
+            return self._send(200, json.dumps(server.stats), 'application/json')
+
+        if not server.bucket.acquire():
+            server.count('rate_limited')
+            return self._send(429, 'Too Many Requests')
+
+        if server.latency_ms > 0:
+            time.sleep(max(0.0, random.gauss(server.latency_ms, server.latency_ms * server.jitter)) / 1000.0)
+
+        if random.random() < server.error_rate:
+            server.count('errors')
+            return self._send(500, 'Internal Server Error')
+
+        if server.recorder is not None:
+            return self._proxy()
+
+        replay = server.replay.get(self.path)
+        if replay is not None:
+            server.count('replayed')
+            body, content_type = replay
+            return self._send(200, body, content_type)
+
+        server.count('synthesized')
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        path = parts.path
+
+        if path == '/v5/stock/chart/kline.json':
+            payload = synth_kline(query.get('symbol', 'SH000001'), int(query.get('begin', time.time() * 1000)),
+                                  int(query.get('count', -10)))
+            return self._send(200, json.dumps(payload), 'application/json')
+        if path.startswith('/new/') and path.endswith('/worth.html'):
+            return self._send(200, synth_ths_worth(path.split('/')[2]), 'text/html; charset=gbk', 'gbk')
+        if path == '/www/sc/stocks/realtime/quote_profit.php':
+            return self._send(200, synth_etnet_profit(query.get('code', '00700')), 'text/html; charset=utf-8')
+        if path.startswith('/q='):
+            return self._send(200, synth_tencent_quotes(path[3:].split(',')), 'text/plain; charset=gbk', 'gbk')
+        if path.startswith('/v4/latest/'):
+            return self._send(200, json.dumps({'base': path.rsplit('/', 1)[-1], 'rates': {'CNY': 0.92}}),
+                              'application/json')
+
+        server.count('not_found')
+        return self._send(404, 'Not Found')
+
+    def _proxy(self):
+        """录制模式：转发到真实数据源，成功的响应保存到录制目录"""
+        server = self.server
+        url = upstream_url(urlsplit(self.path).path)
+        if url is None:
+            server.count('not_found')
+            return self._send(404, 'Not Found')
+        query = urlsplit(self.path).query
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        try:
+            response = requests.get(url + (f'?{query}' if query else ''), headers=headers, timeout=30)
+        except requests.RequestException as e:
+            logging.error(f"转发请求失败: {self.path}: {e}")
+            server.count('upstream_errors')
+            return self._send(502, 'Bad Gateway')
+
+        content_type = response.headers.get('Content-Type', 'application/octet-stream')
+        if response.status_code == 200:
+            server.recorder.save(self.path, content_type, response.content)
+            server.count('recorded')
+        else:
+            server.count('upstream_errors')
+        return self._send(response.status_code, response.content, content_type)
+
+
+class MockMarketServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, jitter=0.2, error_rate=0.0, rate_limit=0, replay_dirs=(),
+                 record_dir=None):
+        super().__init__(address, MockMarketHandler)
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit)
+        self.replay = ReplayStore(*replay_dirs)
+        self.recorder = ResponseRecorder(record_dir) if record_dir else None
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(port=0, **kwargs):
+    """在后台线程启动模拟服务器，返回服务器对象（测试和压测脚本使用）"""
+    server = MockMarketServer(('127.0.0.1', port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='本地行情模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--latency', type=float, default=0, help='平均响应延迟(毫秒)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='延迟抖动系数（标准差/平均延迟）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500错误的比例')
+    parser.add_argument('--rate-limit', type=float, default=0, help='每秒允许的请求数，超出返回429，0为不限流')
+    parser.add_argument('--replay-dir', action='append',
+                        help=f'回放响应的目录，可重复指定，后指定的优先（默认 {HTTP_CACHE_DIR} 和 {MOCK_RECORDING_DIR}）')
+    parser.add_argument('--record', action='store_true', help='录制模式：转发到真实数据源并保存所有接口的响应')
+    parser.add_argument('--record-dir', default=MOCK_RECORDING_DIR, help='录制响应的保存目录')
+    args = parser.parse_args()
+
+    server = MockMarketServer((args.host, args.port), latency_ms=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate, rate_limit=args.rate_limit,
+                              replay_dirs=args.replay_dir or [HTTP_CACHE_DIR, MOCK_RECORDING_DIR],
+                              record_dir=args.record_dir if args.record else None)
+    logging.info(f"模拟服务器已启动: {server.base_url}  (MARKET_DATA_BASE_URL={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"请求统计: {server.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
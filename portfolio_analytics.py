@@ -0,0 +1,190 @@
+# 组合风险与估值分析模块
+import os
+import json
+import sqlite3
+import logging
+import numpy as np
+from config import (DB_PATH, OUTPUT_JSON_DIR, RISK_FREE_RATE, ANALYTICS_LOOKBACK_DAYS,
+                    ROLLING_SHARPE_WINDOW)
+from instruments import resolve
+from artifacts import atomic_write_json
+from valuation_rules import valuation_bucket
+from retention import RetentionPolicy
+
+TRADING_DAYS = 250
+MAX_DAILY_RETURN = 0.5
+VALUATION_FIELDS = ['current_close', 'current_pe', 'reasonable_pe', 'pe_percentile_90', 'pe_buy_point',
+                    'profit_buy_point']
+
+
+def to_valuation_symbol(stock_code):
+    """持仓代码转换为估值库中的股票代码，如 600519 -> SH600519, hk00700 -> HK00700"""
+    return resolve(stock_code).symbol
+
+
+def load_close_matrix(conn, symbols, lookback=ANALYTICS_LOOKBACK_DAYS):
+    """一次查询加载所有持仓最近lookback个交易日的收盘价，返回(交易日时间戳, 收盘价矩阵[日期, 股票])"""
+    placeholders = ', '.join('?' * len(symbols))
+    rows = conn.execute(f'''
+        SELECT symbol, timestamp, close FROM (
+            SELECT symbol, timestamp, close,
+                   ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) AS rn
+            FROM stock_basic_data
+            WHERE symbol IN ({placeholders})
+        ) WHERE rn <= ?
+    ''', (*symbols, lookback)).fetchall()
+    if not rows:
+        return np.array([], dtype='int64'), np.empty((0, len(symbols)))
+
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+    row_symbols, timestamps, closes = zip(*rows)
+    dates, date_index = np.unique(np.array(timestamps, dtype='int64'), return_inverse=True)
+    matrix = np.full((len(dates), len(symbols)), np.nan)
+    matrix[date_index, [column[s] for s in row_symbols]] = closes
+
+    # A股和港股交易日不同，缺失的收盘价沿用前一交易日
+    valid = ~np.isnan(matrix)
+    last_valid = np.where(valid, np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    matrix = matrix[last_valid, np.arange(len(symbols))]
+    return dates, matrix
+
+
+def load_latest_valuations(conn, symbols):
+    """获取持仓股票最新一条估值记录"""
+    placeholders = ', '.join('?' * len(symbols))
+    rows = conn.execute(f'''
+        SELECT v.symbol, v.current_close, v.current_pe, v.reasonable_pe, v.pe_percentile_90,
+               v.pe_buy_point, v.profit_buy_point
+        FROM stock_valuation v
+        JOIN (SELECT symbol, MAX(timestamp) AS timestamp FROM stock_valuation
+              WHERE symbol IN ({placeholders}) GROUP BY symbol) latest
+        ON v.symbol = latest.symbol AND v.timestamp = latest.timestamp
+    ''', symbols).fetchall()
+    return {row[0]: dict(zip(VALUATION_FIELDS, row[1:])) for row in rows}
+
+
+def covariance_risk(matrix, weights):
+    """根据收盘价矩阵计算年化协方差矩阵、组合波动率及各持仓风险贡献"""
+    returns = matrix[1:] / matrix[:-1] - 1
+    returns = np.nan_to_num(returns)
+    if len(returns) < 2:
+        return None, None, None
+    cov = np.cov(returns, rowvar=False) * TRADING_DAYS
+    cov = np.atleast_2d(cov)
+    variance = float(weights @ cov @ weights)
+    volatility = np.sqrt(variance) if variance > 0 else 0.0
+    contribution = weights * (cov @ weights) / variance if variance > 0 else np.zeros_like(weights)
+    return cov, volatility, contribution
+
+
+def trend_performance(trend_data, window=ROLLING_SHARPE_WINDOW, risk_free_rate=RISK_FREE_RATE):
+    """根据每日市值趋势计算剔除资金转入影响后的最大回撤和滚动夏普比率
+
+    相邻两个点视为相邻交易日，传入的数据必须是未降采样的每日数据
+    """
+    if len(trend_data) < 2:
+        return None, []
+    dates = [record['date'] for record in trend_data]
+    values = np.array([record['portfolio_value'] for record in trend_data], dtype=float)
+    costs = np.array([record['investment_cost'] for record in trend_data], dtype=float)
+
+    # 当日收益 = (当日市值 - 当日新增投入) / 前一日市值 - 1
+    flows = np.diff(costs)
+    returns = np.where(values[:-1] > 0, (values[1:] - flows) / np.where(values[:-1] > 0, values[:-1], 1) - 1, 0.0)
+    # 单日涨跌超过50%视为记录异常（如行情接口失败时写入的市值），不计入收益
+    returns = np.where(np.abs(returns) > MAX_DAILY_RETURN, 0.0, returns)
+
+    nav = np.cumprod(1 + returns)
+    drawdown = nav / np.maximum.accumulate(nav) - 1
+    max_drawdown = float(min(drawdown.min(), 0.0))
+
+    rolling_sharpe = []
+    if len(returns) >= window:
+        excess = returns - risk_free_rate / TRADING_DAYS
+        csum = np.concatenate(([0.0], np.cumsum(excess)))
+        csum_sq = np.concatenate(([0.0], np.cumsum(excess ** 2)))
+        mean = (csum[window:] - csum[:-window]) / window
+        var = (csum_sq[window:] - csum_sq[:-window]) / window - mean ** 2
+        std = np.sqrt(np.clip(var * window / (window - 1), 0, None))
+        sharpe = np.where(std > 0, mean / np.where(std > 0, std, 1) * np.sqrt(TRADING_DAYS), 0.0)
+        rolling_sharpe = [{'date': date, 'sharpe': round(float(value), 2)}
+                          for date, value in zip(dates[window:], sharpe)]
+    return max_drawdown, rolling_sharpe
+
+
+def weighted_pe(weights, valuations):
+    """按持仓权重计算组合市盈率与合理市盈率（盈利收益率加权，即调和平均）"""
+    pe = np.array([v['current_pe'] if v else np.nan for v in valuations], dtype=float)
+    reasonable = np.array([v['reasonable_pe'] if v else np.nan for v in valuations], dtype=float)
+    covered = (pe > 0) & (reasonable > 0)
+    if not covered.any():
+        return None, None, 0.0
+    w = weights[covered] / weights[covered].sum()
+    portfolio_pe = 1 / float(np.sum(w / pe[covered]))
+    portfolio_reasonable_pe = 1 / float(np.sum(w / reasonable[covered]))
+    return portfolio_pe, portfolio_reasonable_pe, float(weights[covered].sum())
+
+
+def compute_portfolio_analytics(position_result, trend_data, db_path=DB_PATH):
+    """计算组合的协方差矩阵、波动率、最大回撤、滚动夏普和加权市盈率"""
+    positions = [p for p in position_result.get('positions', []) if resolve(p.get('股票代码')).market != 'CASH']
+    total_value = position_result.get('portfolio_value') or 0
+    analytics = {'date': position_result.get('date')}
+
+    # 早于每日保留期的趋势数据已降采样为周/月数据（retention.py），收益按相邻交易日计算，只使用每日数据部分
+    daily_cutoff = RetentionPolicy().daily_cutoff
+    max_drawdown, rolling_sharpe = trend_performance([r for r in trend_data if r['date'] >= daily_cutoff])
+    analytics['max_drawdown'] = round(max_drawdown, 4) if max_drawdown is not None else None
+    analytics['rolling_sharpe'] = rolling_sharpe
+    analytics['latest_sharpe'] = rolling_sharpe[-1]['sharpe'] if rolling_sharpe else None
+
+    if not positions or total_value <= 0 or not os.path.exists(db_path):
+        return analytics
+
+    symbols = [to_valuation_symbol(p['股票代码']) for p in positions]
+    # 现金部分不参与波动，权重按组合总市值计算
+    weights = np.array([p['持仓市值'] for p in positions], dtype=float) / total_value
+
+    conn = sqlite3.connect(db_path)
+    try:
+        _, matrix = load_close_matrix(conn, symbols)
+        valuations = load_latest_valuations(conn, symbols)
+    finally:
+        conn.close()
+
+    cov, volatility, contribution = (None, None, None)
+    if len(matrix) > 2:
+        cov, volatility, contribution = covariance_risk(matrix, weights)
+
+    position_valuations = [valuations.get(s) for s in symbols]
+    portfolio_pe, portfolio_reasonable_pe, pe_coverage = weighted_pe(weights, position_valuations)
+
+    analytics.update({
+        'symbols': symbols,
+        'weights': [round(float(w), 4) for w in weights],
+        'volatility': round(float(volatility), 4) if volatility is not None else None,
+        'risk_contribution': [round(float(c), 4) for c in contribution] if contribution is not None else None,
+        'covariance': np.round(cov, 6).tolist() if cov is not None else None,
+        'portfolio_pe': round(portfolio_pe, 2) if portfolio_pe else None,
+        'portfolio_reasonable_pe': round(portfolio_reasonable_pe, 2) if portfolio_reasonable_pe else None,
+        'pe_valuation': round(portfolio_pe / portfolio_reasonable_pe, 2) if portfolio_pe else None,
+        'pe_coverage': round(pe_coverage, 4),
+        'valuation_buckets': [valuation_bucket(v) if v else None for v in position_valuations],
+    })
+    return analytics
+
+
+def save_portfolio_analytics(position_result):
+    """计算组合分析指标并保存到 portfolio_analytics.json"""
+    try:
+        with open(f"{OUTPUT_JSON_DIR}/market_trend.json", "r", encoding="utf-8") as trend_file:
+            trend_data = json.load(trend_file)
+    except Exception:
+        trend_data = []
+
+    analytics = compute_portfolio_analytics(position_result, trend_data)
+    atomic_write_json(f"{OUTPUT_JSON_DIR}/portfolio_analytics.json", analytics, indent=4)
+    logging.info(f"组合分析完成: 波动率 {analytics.get('volatility')} 最大回撤 {analytics.get('max_drawdown')} "
+                 f"组合市盈率 {analytics.get('portfolio_pe')}")
+    return analytics
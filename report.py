@@ -0,0 +1,241 @@
+# 持仓报告生成模块
+import json
+import html
+import logging
+from string import Template
+from config import REPORT_FORMATS, REPORT_MARKDOWN_FILE, REPORT_JSON_FILE, REPORT_HTML_FILE
+from artifacts import write_text_if_changed
+from instruments import resolve
+from portfolio_analytics import to_valuation_symbol
+from valuation_rules import VALUATION_BUCKETS
+
+MARKET_LABELS = {'cn': 'A股', 'hk': '港股', 'us': '美股', 'cash': '现金'}
+BUCKET_LABELS = {
+    'double_buy': '双买点（低于市盈率和利润买点）',
+    'single_buy': '单买点（低于其中一个买点）',
+    'sell': '卖点（高于90%分位市盈率）',
+    'hold': '持有',
+    None: '无估值数据',
+}
+# 今日涨跌幅最大的持仓数量
+TOP_MOVERS = 5
+
+# 报告内容只包含数据日期，不包含生成时间，数据不变时内容不变
+MARKDOWN_TEMPLATE = Template("""# 投资组合概览
+
+**数据日期**: $date
+
+$sections""")
+
+HTML_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="UTF-8">
+<title>投资组合概览 - $date</title>
+<style>
+body { font-family: -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif; margin: 24px; color: #333; }
+table { border-collapse: collapse; margin-bottom: 24px; }
+th, td { border: 1px solid #ddd; padding: 6px 12px; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+th { background: #f5f5f5; }
+</style>
+</head>
+<body>
+<h1>投资组合概览</h1>
+<p><strong>数据日期</strong>: $date</p>
+$sections
+</body>
+</html>
+""")
+
+
+def format_number(num):
+    """格式化数字显示（按绝对值选择单位，亏损同样显示为万/亿）"""
+    if abs(num) >= 100000000:
+        return f"{num/100000000:.2f}亿"
+    elif abs(num) >= 10000:
+        return f"{num/10000:.2f}万"
+    else:
+        return f"{num:.2f}"
+
+
+def position_market(stock_code):
+    """持仓所属市场：cn-A股, hk-港股, us-美股, cash-现金"""
+    return resolve(stock_code).region
+
+
+def calculate_portfolio_stats(data):
+    """计算投资组合统计信息（不修改传入的持仓数据）"""
+    if not data:
+        return None
+
+    total_value = data.get('portfolio_value', 0)
+    total_cost = data.get('investment_cost', 0)
+    total_profit = total_value - total_cost
+    total_profit_rate = (total_profit / total_cost * 100) if total_cost > 0 else 0
+
+    # 计算各持仓占比
+    positions = []
+    for position in data.get('positions', []):
+        position_value = position.get('持仓市值', 0)
+        positions.append(dict(position, 持仓占比=(position_value / total_value * 100) if total_value > 0 else 0))
+
+    return {
+        'total_value': total_value,
+        'total_cost': total_cost,
+        'total_profit': total_profit,
+        'total_profit_rate': total_profit_rate,
+        'positions': positions
+    }
+
+
+def table(title, columns, rows):
+    return {'title': title, 'columns': columns, 'rows': rows}
+
+
+def overview_section(stats):
+    return table('组合总体情况', ['指标', '数值'], [
+        ['总市值', format_number(stats['total_value'])],
+        ['总投资成本', format_number(stats['total_cost'])],
+        ['总盈亏', format_number(stats['total_profit'])],
+        ['总盈亏率', f"{stats['total_profit_rate']:.2f}%"],
+    ])
+
+
+def positions_section(stats):
+    return table('持仓明细', ['股票代码', '股票名称', '持仓数量', '当前价', '持仓市值', '持仓占比'], [
+        [p.get('股票代码', ''), p.get('股票名称', ''), p.get('持仓数量', 0), f"{p.get('当前价', 0):.2f}",
+         format_number(p.get('持仓市值', 0)), f"{p.get('持仓占比', 0):.2f}%"]
+        for p in stats['positions']
+    ])
+
+
+def market_section(stats):
+    """按市场汇总持仓"""
+    groups = {}
+    for position in stats['positions']:
+        group = groups.setdefault(position_market(position.get('股票代码', '')), [0, 0.0, 0.0, 0.0])
+        group[0] += 1
+        group[1] += position.get('持仓市值', 0)
+        group[2] += position.get('持仓占比', 0)
+        group[3] += position.get('持仓盈亏', 0)
+    return table('按市场', ['市场', '持仓数量', '持仓市值', '持仓占比', '持仓盈亏'], [
+        [MARKET_LABELS[market], count, format_number(value), f"{ratio:.2f}%", format_number(profit)]
+        for market, (count, value, ratio, profit) in ((m, groups[m]) for m in MARKET_LABELS if m in groups)
+    ])
+
+
+def bucket_section(stats, analytics):
+    """按估值分组汇总持仓，估值分组来自组合分析结果"""
+    buckets = dict(zip(analytics.get('symbols') or [], analytics.get('valuation_buckets') or []))
+    groups = {}
+    for position in stats['positions']:
+        stock_code = position.get('股票代码', '')
+        if position_market(stock_code) == 'cash':
+            continue
+        groups.setdefault(buckets.get(to_valuation_symbol(stock_code)), []).append(position)
+    rows = []
+    for bucket in VALUATION_BUCKETS + [None]:
+        if bucket not in groups:
+            continue
+        positions = groups[bucket]
+        rows.append([
+            BUCKET_LABELS[bucket],
+            '、'.join(p.get('股票名称', '') for p in positions),
+            format_number(sum(p.get('持仓市值', 0) for p in positions)),
+            f"{sum(p.get('持仓占比', 0) for p in positions):.2f}%",
+        ])
+    return table('按估值分组', ['估值分组', '股票', '持仓市值', '持仓占比'], rows)
+
+
+def movers_section(stats, top=TOP_MOVERS):
+    """今日涨跌幅绝对值最大的持仓，当日盈亏按今日涨跌幅估算"""
+    stocks = [p for p in stats['positions'] if position_market(p.get('股票代码', '')) != 'cash']
+    stocks.sort(key=lambda p: abs(p.get('今日涨跌幅') or 0), reverse=True)
+    rows = []
+    for p in stocks[:top]:
+        change = p.get('今日涨跌幅') or 0
+        value = p.get('持仓市值', 0)
+        day_profit = value - value / (1 + change / 100) if change > -100 else 0
+        rows.append([p.get('股票代码', ''), p.get('股票名称', ''), f"{change:.2f}%", format_number(day_profit)])
+    return table('今日涨跌', ['股票代码', '股票名称', '今日涨跌幅', '当日盈亏（估算）'], rows)
+
+
+def build_report(position_result, analytics=None):
+    """根据持仓结果和组合分析结果生成报告数据，各视图为独立的表格"""
+    stats = calculate_portfolio_stats(position_result)
+    if not stats:
+        return None
+
+    sections = [overview_section(stats), positions_section(stats), market_section(stats)]
+    if analytics and analytics.get('valuation_buckets'):
+        sections.append(bucket_section(stats, analytics))
+    sections.append(movers_section(stats))
+
+    return {
+        'date': position_result.get('date', '未知日期'),
+        'summary': {
+            'total_value': round(stats['total_value'], 2),
+            'total_cost': round(stats['total_cost'], 2),
+            'total_profit': round(stats['total_profit'], 2),
+            'total_profit_rate': round(stats['total_profit_rate'], 2),
+            'positions': len(stats['positions']),
+        },
+        'sections': [section for section in sections if section['rows']],
+        'conclusion': [
+            f"**组合总市值**: {format_number(stats['total_value'])}",
+            f"**总投资成本**: {format_number(stats['total_cost'])}",
+            f"**累计盈亏**: {format_number(stats['total_profit'])} ({stats['total_profit_rate']:.2f}%)",
+            f"**持仓数量**: {len(stats['positions'])} 只股票",
+        ],
+    }
+
+
+def render_markdown(report):
+    parts = []
+    for section in report['sections']:
+        lines = [f"## {section['title']}", '',
+                 '| ' + ' | '.join(section['columns']) + ' |',
+                 '|' + '|'.join('-' * max(6, len(column) * 2 + 2) for column in section['columns']) + '|']
+        lines += ['| ' + ' | '.join(str(cell) for cell in row) + ' |' for row in section['rows']]
+        parts.append('\n'.join(lines) + '\n')
+    parts.append('## 总结\n\n' + '\n'.join(f"- {item}" for item in report['conclusion']) + '\n')
+    return MARKDOWN_TEMPLATE.substitute(date=report['date'], sections='\n'.join(parts))
+
+
+def render_html(report):
+    parts = []
+    for section in report['sections']:
+        header = ''.join(f"<th>{html.escape(column)}</th>" for column in section['columns'])
+        body = ''.join(
+            '<tr>' + ''.join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + '</tr>\n'
+            for row in section['rows']
+        )
+        parts.append(f"<h2>{html.escape(section['title'])}</h2>\n<table>\n<tr>{header}</tr>\n{body}</table>")
+    return HTML_TEMPLATE.substitute(date=html.escape(report['date']), sections='\n'.join(parts))
+
+
+def render_json(report):
+    return json.dumps(report, ensure_ascii=False, indent=2) + '\n'
+
+
+RENDERERS = {
+    'markdown': (render_markdown, REPORT_MARKDOWN_FILE),
+    'json': (render_json, REPORT_JSON_FILE),
+    'html': (render_html, REPORT_HTML_FILE),
+}
+
+
+def generate_reports(position_result, analytics=None, formats=REPORT_FORMATS):
+    """生成各格式的持仓报告，内容未变化的文件不重写，返回{格式: 是否写入}"""
+    report = build_report(position_result, analytics)
+    if not report:
+        logging.warning("没有持仓数据，跳过报告生成")
+        return {}
+
+    written = {}
+    for output_format in formats:
+        render, path = RENDERERS[output_format]
+        written[output_format] = write_text_if_changed(path, render(report))
+        logging.info(f"持仓报告 {path}: {'已更新' if written[output_format] else '内容未变化，跳过写入'}")
+    return written
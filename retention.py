@@ -0,0 +1,193 @@
+# 历史数据分层保留模块
+import os
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from config import (DB_PATH, OUTPUT_JSON_DIR, RETENTION_DAILY_MONTHS, RETENTION_WEEKLY_MONTHS,
+                    RETENTION_VACUUM_DAYS, beijing_tz)
+from artifacts import atomic_write_json
+from database import SQLITE_BUSY_TIMEOUT
+
+MARKET_TREND_FILE = f"{OUTPUT_JSON_DIR}/market_trend.json"
+
+# 每个股票每个保留分组内除最后一条外的估值记录；每日分组内只有一条，只需检查早于每日保留期的数据
+STALE_VALUATION_SQL = '''
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY symbol, retention_bucket(trade_date) ORDER BY timestamp DESC
+        ) AS rn
+        FROM stock_valuation
+        WHERE trade_date < ?
+    ) WHERE rn > 1
+'''
+
+
+def months_before(day, months):
+    """day往前推months个月的同一天，目标月份没有该日时取月末"""
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    month += 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return date(year, month, min(day.day, (next_month - timedelta(days=1)).day))
+
+
+class RetentionPolicy:
+    """分层保留策略：最近daily_months个月保留每日数据，其后至weekly_months个月保留每周最后一条，
+    更早的数据保留每月最后一条
+
+    分组以交易日期计算，同一参考日期下重复执行结果不变；参考日期后移时，跨过分层边界的数据被继续降采样
+    """
+
+    def __init__(self, today=None, daily_months=RETENTION_DAILY_MONTHS, weekly_months=RETENTION_WEEKLY_MONTHS):
+        if weekly_months < daily_months:
+            raise ValueError(f"按周保留的月数({weekly_months})不能小于按日保留的月数({daily_months})")
+        today = today or datetime.now(beijing_tz).date()
+        self.daily_cutoff = months_before(today, daily_months).isoformat()
+        self.weekly_cutoff = months_before(today, weekly_months).isoformat()
+
+    def bucket(self, trade_date):
+        """交易日期(YYYY-MM-DD)所属的保留分组，同一分组只保留最后一条"""
+        if trade_date >= self.daily_cutoff:
+            return trade_date
+        if trade_date >= self.weekly_cutoff:
+            day = date.fromisoformat(trade_date)
+            return 'W' + (day - timedelta(days=day.weekday())).isoformat()
+        return 'M' + trade_date[:7]
+
+    def thin(self, records, key='date'):
+        """按日期降采样记录列表，返回按日期升序排列的保留记录"""
+        records = sorted(records, key=lambda record: record[key])
+        last = {}
+        for i, record in enumerate(records):
+            last[self.bucket(record[key])] = i
+        return [records[i] for i in sorted(last.values())]
+
+
+def _connect(db_path):
+    """打开数据库连接（自动提交模式），并确保维护信息表存在"""
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+    ''')
+    return conn
+
+
+def get_meta(conn, key):
+    row = conn.execute('SELECT value FROM maintenance_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO maintenance_meta (key, value) VALUES (?, ?)', (key, value))
+
+
+def downsample_valuations(policy, db_path=DB_PATH, dry_run=False):
+    """按保留策略删除stock_valuation中的多余历史记录，返回删除（dry_run时为待删除）条数"""
+    conn = _connect(db_path)
+    conn.create_function('retention_bucket', 1, policy.bucket, deterministic=True)
+    try:
+        if dry_run:
+            return conn.execute(f'SELECT COUNT(*) FROM ({STALE_VALUATION_SQL})', (policy.daily_cutoff,)).fetchone()[0]
+        conn.execute('BEGIN IMMEDIATE')
+        count = conn.execute(f'DELETE FROM stock_valuation WHERE id IN ({STALE_VALUATION_SQL})',
+                             (policy.daily_cutoff,)).rowcount
+        # 没有删除数据时不写入，数据未变化时数据库文件保持不变
+        if count:
+            set_meta(conn, 'last_retention', datetime.now(beijing_tz).strftime('%Y-%m-%d %H:%M:%S'))
+        conn.commit()
+        return count
+    except Exception as e:
+        logging.error(f"估值历史降采样失败: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def downsample_market_trend(policy, path=MARKET_TREND_FILE, dry_run=False):
+    """按保留策略降采样市值趋势文件，返回删除（dry_run时为待删除）的点数"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            trend_data = json.load(f)
+    except FileNotFoundError:
+        return 0
+
+    kept = policy.thin(trend_data)
+    removed = len(trend_data) - len(kept)
+    if removed and not dry_run:
+        atomic_write_json(path, kept, indent=4)
+    return removed
+
+
+def vacuum_if_due(db_path=DB_PATH, interval_days=RETENTION_VACUUM_DAYS, force=False, dry_run=False):
+    """距上次VACUUM超过interval_days天（或从未执行）且有空闲页时整理数据库文件，返回是否执行
+
+    没有空闲页时VACUUM几乎不能缩小文件，却会改写整个文件，因此跳过
+    """
+    conn = _connect(db_path)
+    try:
+        last_vacuum = get_meta(conn, 'last_vacuum')
+        today = datetime.now(beijing_tz).date()
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        due = force or free_pages > 0 and (
+            last_vacuum is None or (today - date.fromisoformat(last_vacuum[:10])).days >= interval_days)
+        if not due or dry_run:
+            return due
+
+        size_before = os.path.getsize(db_path)
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA optimize')
+        set_meta(conn, 'last_vacuum', today.isoformat())
+        size_after = os.path.getsize(db_path)
+        logging.info(f"数据库VACUUM完成: {size_before / 1024:.1f}KB -> {size_after / 1024:.1f}KB")
+        return True
+    finally:
+        conn.close()
+
+
+def run_retention(db_path=DB_PATH, trend_path=MARKET_TREND_FILE, today=None, dry_run=False, force_vacuum=False):
+    """执行保留策略：降采样估值历史和市值趋势，按计划VACUUM数据库"""
+    policy = RetentionPolicy(today)
+    prefix = '[dry-run] ' if dry_run else ''
+    logging.info(f"{prefix}保留策略: {policy.daily_cutoff} 起保留每日数据，"
+                 f"{policy.weekly_cutoff} 起保留每周数据，更早保留每月数据")
+
+    result = {'valuation_rows': 0, 'trend_points': 0, 'vacuum': False}
+    if os.path.exists(db_path):
+        result['valuation_rows'] = downsample_valuations(policy, db_path, dry_run=dry_run)
+    result['trend_points'] = downsample_market_trend(policy, trend_path, dry_run=dry_run)
+    if os.path.exists(db_path):
+        result['vacuum'] = vacuum_if_due(db_path, force=force_vacuum, dry_run=dry_run)
+
+    logging.info(f"{prefix}估值历史删除 {result['valuation_rows']} 条，市值趋势删除 {result['trend_points']} 个点，"
+                 f"{'执行' if result['vacuum'] else '跳过'}VACUUM")
+    return result
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='估值历史和市值趋势的分层保留与数据库整理')
+    parser.add_argument('--db', default=DB_PATH, help='数据库路径')
+    parser.add_argument('--dry-run', action='store_true', help='只统计待删除的数据，不修改')
+    parser.add_argument('--vacuum', action='store_true', help='忽略计划间隔，立即VACUUM数据库')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        run_retention(args.db, dry_run=True, force_vacuum=args.vacuum)
+        return 0
+
+    from artifacts import run_lock
+    with run_lock():
+        run_retention(args.db, force_vacuum=args.vacuum)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 模块位于仓库根目录，测试时加入导入路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
@@ -0,0 +1,41 @@
+# 估值计算与仓库中提交的模拟快照黄金结果的一致性测试
+# 快照和黄金结果由 python golden_valuation.py synth 生成
+import os
+import pytest
+from golden_valuation import (check_engine, processor_engine, reference_engine, DEFAULT_ABS_TOL,
+                              DEFAULT_REL_TOL)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURE_DB = os.path.join(FIXTURE_DIR, 'valuation_fixture.db')
+GOLDEN_FILE = os.path.join(FIXTURE_DIR, 'valuation_golden.json')
+
+
+def test_processor_matches_golden():
+    assert check_engine(processor_engine, FIXTURE_DB, GOLDEN_FILE, DEFAULT_ABS_TOL, DEFAULT_REL_TOL) == {}
+
+
+def test_reference_matches_golden():
+    assert check_engine(reference_engine, FIXTURE_DB, GOLDEN_FILE, 0, 0) == {}
+
+
+def test_changed_result_is_reported():
+    def shifted_engine(fixture_db, std_multiples):
+        calculate = processor_engine(fixture_db, std_multiples)
+
+        def engine(symbol):
+            result = calculate(symbol)
+            if result:
+                result['pe_buy_point'] += 2 * DEFAULT_ABS_TOL
+            return result
+        return engine
+
+    mismatches = check_engine(shifted_engine, FIXTURE_DB, GOLDEN_FILE, DEFAULT_ABS_TOL, DEFAULT_REL_TOL)
+    assert set(mismatches) == {'SH600519', 'SZ000568', 'HK00700'}
+    assert all(field == 'pe_buy_point' for differences in mismatches.values() for field, _, _ in differences)
+
+
+def test_fixture_mismatch_is_rejected(tmp_path):
+    fixture_db = tmp_path / 'valuation_fixture.db'
+    fixture_db.write_bytes(open(FIXTURE_DB, 'rb').read() + b'\0')
+    with pytest.raises(ValueError):
+        check_engine(processor_engine, str(fixture_db), GOLDEN_FILE)
@@ -0,0 +1,21 @@
+# 估值计算基准测试（pytest-benchmark，随test依赖组安装），默认跳过，设置 RUN_BENCHMARKS=1 运行：
+#   RUN_BENCHMARKS=1 python -m pytest tests/test_valuation_benchmark.py
+import os
+import pytest
+from golden_valuation import load_fixture_symbols, processor_engine, reference_engine, run_engine
+
+pytestmark = pytest.mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason='设置 RUN_BENCHMARKS=1 运行基准测试')
+
+FIXTURE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'valuation_fixture.db')
+
+
+def run_all(engine, symbols):
+    return [run_engine(engine, symbol) for symbol in symbols]
+
+
+@pytest.mark.parametrize('engine_factory', [reference_engine, processor_engine], ids=['reference', 'processor'])
+def test_valuation_speed(benchmark, engine_factory):
+    std_multiples = load_fixture_symbols(FIXTURE_DB)
+    engine = engine_factory(FIXTURE_DB, std_multiples)
+    results = benchmark(run_all, engine, list(std_multiples))
+    assert len(results) == len(std_multiples)
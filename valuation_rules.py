@@ -0,0 +1,18 @@
+# 估值规则模块（不依赖pandas，供数据处理、持仓分析和报告共用）
+
+# 估值分组，与首页行颜色规则一致
+VALUATION_BUCKETS = ['double_buy', 'single_buy', 'sell', 'hold']
+
+
+def valuation_bucket(data):
+    """估值分组，与首页行颜色规则一致"""
+    current_close = data.get('current_close') or 0
+    below_pe_buy = current_close <= (data.get('pe_buy_point') or 0)
+    below_profit_buy = current_close <= (data.get('profit_buy_point') or 0)
+    if below_pe_buy and below_profit_buy:
+        return 'double_buy'
+    if below_pe_buy or below_profit_buy:
+        return 'single_buy'
+    if (data.get('pe_percentile_90') or 0) <= (data.get('current_pe') or 0):
+        return 'sell'
+    return 'hold'